@@ -0,0 +1,85 @@
+"""
+Arbitru pentru comenzile motoarelor.
+
+Aplicațiile de tip joystick trimit comenzi în rafale. În loc să fie
+executată fiecare comandă, arbitrul păstrează doar ultima comandă primită
+și o aplică la fiecare tact de acționare, la o frecvență fixă. Astfel,
+numărul de scrieri GPIO nu depinde de câte comenzi sosesc, iar întârzierea
+unei comenzi este de cel mult o perioadă de acționare.
+"""
+
+import threading
+import time
+
+ACTUATION_RATE = 50  # Hz
+
+
+class CommandArbiter(threading.Thread):
+    """
+    Fir de execuție care aplică cea mai recentă comandă la fiecare tact.
+
+    Parametri:
+    - apply: funcția care execută o comandă (de exemplu process_command)
+    - rate: frecvența tactului de acționare, în Hz
+    """
+
+    def __init__(self, apply, rate=ACTUATION_RATE):
+        threading.Thread.__init__(self, daemon=True)
+        self.apply = apply
+        self.period = 1.0 / rate
+        self.lock = threading.Lock()
+        self.pending = None
+        self.running = True
+
+        # Statistici
+        self.submitted = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.max_latency = 0.0
+
+    def submit(self, command):
+        """Înlocuiește comanda în așteptare; comanda anterioară neaplicată se pierde"""
+        with self.lock:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (command, time.monotonic())
+            self.submitted += 1
+
+    def take(self):
+        with self.lock:
+            pending, self.pending = self.pending, None
+        return pending
+
+    def run(self):
+        next_tick = time.monotonic()
+        while self.running:
+            pending = self.take()
+            if pending is not None:
+                command, received = pending
+                try:
+                    self.apply(command)
+                except Exception as e:
+                    print(f"Eroare la aplicarea comenzii {command}: {e}")
+                self.applied += 1
+                self.max_latency = max(self.max_latency, time.monotonic() - received)
+
+            # Tact fix; dacă o comandă a durat prea mult, se resincronizează
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def close(self):
+        self.running = False
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=1.0)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "applied": self.applied,
+            "max_latency_ms": self.max_latency * 1000,
+        }
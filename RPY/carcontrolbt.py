@@ -24,7 +24,12 @@ import array
 import RPi.GPIO as GPIO
 import time
 import logging
+import os
 import sys
+import threading
+
+import reflex
+from arbiter import CommandArbiter
 
 # Configurare logging
 logging.basicConfig(level=logging.INFO)
@@ -58,6 +63,29 @@ pwm_motor2_backward.start(0)
 # Variabilă pentru stocarea valorii de viteză
 motor_speed = 100  # Valoare implicită 100%
 
+# Lacăt comun pentru comenzi și reflexul de evitare a coliziunilor
+motor_lock = threading.RLock()
+
+# Timp mort la schimbarea sensului unei roți: pinul vechi se oprește, se
+# așteaptă DEAD_TIME, apoi pornește pinul nou (protecție pentru punțile H)
+DEAD_TIME = 0.01  # secunde
+
+# Ultimul duty cycle scris pe fiecare pin; scrierile identice sunt omise
+pwm_duty = {
+    pwm_motor1_forward: 0,
+    pwm_motor1_backward: 0,
+    pwm_motor2_forward: 0,
+    pwm_motor2_backward: 0,
+}
+pwm_writes = 0
+pwm_writes_skipped = 0
+
+# Sensul roților este anunțat lui sendmapdata.py, pentru semnul impulsurilor Hall
+motion_publisher = reflex.MotionPublisher()
+
+# Configurația reflexului (opțională), lângă acest script
+REFLEX_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reflex_config.json')
+
 # Pauză de stabilizare pentru a permite setărilor să se aplice
 time.sleep(0.5)
 
@@ -71,12 +99,58 @@ def safe_output_pwm(pwm_pin, state, speed=None):
     - state: True pentru pornit, False pentru oprit
     - speed: Viteza (0-100%) - se folosește doar când state este True
     """
-    if state:
-        # Activează pinul cu viteza specificată
-        pwm_pin.ChangeDutyCycle(speed)
-    else:
-        # Dezactivează pinul
-        pwm_pin.ChangeDutyCycle(0)
+    global pwm_writes, pwm_writes_skipped
+    
+    duty = speed if state else 0
+    
+    # Nu rescrie un duty cycle care este deja aplicat
+    if pwm_duty[pwm_pin] == duty:
+        pwm_writes_skipped += 1
+        return
+    
+    # Activează pinul cu viteza specificată sau îl dezactivează
+    pwm_pin.ChangeDutyCycle(duty)
+    pwm_duty[pwm_pin] = duty
+    pwm_writes += 1
+
+def set_motors(motor1_forward, motor1_backward, motor2_forward, motor2_backward):
+    """
+    Aplică duty cycle-urile pentru cei patru pini, în mod sigur pentru punțile H
+    
+    Întâi se opresc pinii care trebuie opriți; dacă o roată își schimbă sensul,
+    se așteaptă DEAD_TIME înainte de a porni pinul pentru sensul nou.
+    
+    Ține motor_lock, ca pwm_duty să rămână corect și când funcția e apelată
+    din afara process_command (oprirea de siguranță, curățarea).
+    """
+    targets = [
+        (pwm_motor1_forward, motor1_forward, pwm_motor1_backward),
+        (pwm_motor1_backward, motor1_backward, pwm_motor1_forward),
+        (pwm_motor2_forward, motor2_forward, pwm_motor2_backward),
+        (pwm_motor2_backward, motor2_backward, pwm_motor2_forward),
+    ]
+    
+    with motor_lock:
+        # O roată își schimbă sensul dacă pinul opus era pornit
+        reversing = any(duty > 0 and pwm_duty[opposite] > 0
+                        for _, duty, opposite in targets)
+        
+        # Oprește întâi direcțiile care nu mai sunt folosite
+        for pwm_pin, duty, _ in targets:
+            if duty == 0:
+                safe_output_pwm(pwm_pin, False)
+        
+        if reversing and DEAD_TIME > 0:
+            time.sleep(DEAD_TIME)
+        
+        # Apoi activează direcțiile dorite
+        for pwm_pin, duty, _ in targets:
+            if duty > 0:
+                safe_output_pwm(pwm_pin, True, duty)
+        
+        # Motorul 1 este roata stângă, motorul 2 roata dreaptă
+        motion_publisher.publish((motor1_forward > 0) - (motor1_backward > 0),
+                                 (motor2_forward > 0) - (motor2_backward > 0))
 
 def forward(speed=None):
     """
@@ -88,15 +162,12 @@ def forward(speed=None):
     # Folosește viteza furnizată sau cea globală
     use_speed = speed if speed is not None else motor_speed
     
-    print(f"Mers înainte cu viteza {use_speed}%")
+    # Reflexul poate reduce viteza dacă există un obstacol în față
+    use_speed = reflex_layer.limit_speed("F", use_speed)
     
-    # Oprește întâi direcțiile opuse
-    safe_output_pwm(pwm_motor1_backward, False)
-    safe_output_pwm(pwm_motor2_backward, False)
+    print(f"Mers înainte cu viteza {use_speed}%")
     
-    # Apoi activează direcțiile dorite cu viteza specificată
-    safe_output_pwm(pwm_motor1_forward, True, use_speed)
-    safe_output_pwm(pwm_motor2_forward, True, use_speed)
+    set_motors(use_speed, 0, use_speed, 0)
 
 def backward(speed=None):
     """Mișcă robotul înapoi cu viteza specificată"""
@@ -104,13 +175,11 @@ def backward(speed=None):
     
     use_speed = speed if speed is not None else motor_speed
     
-    print(f"Mers înapoi cu viteza {use_speed}%")
+    use_speed = reflex_layer.limit_speed("B", use_speed)
     
-    safe_output_pwm(pwm_motor1_forward, False)
-    safe_output_pwm(pwm_motor2_forward, False)
+    print(f"Mers înapoi cu viteza {use_speed}%")
     
-    safe_output_pwm(pwm_motor1_backward, True, use_speed)
-    safe_output_pwm(pwm_motor2_backward, True, use_speed)
+    set_motors(0, use_speed, 0, use_speed)
 
 def turn_left(speed=None):
     """Viraj la stânga cu viteza specificată - rotire diferențială"""
@@ -118,15 +187,13 @@ def turn_left(speed=None):
     
     use_speed = speed if speed is not None else motor_speed
     
-    print(f"Viraj stânga cu viteza {use_speed}%")
+    # Virajele sunt pe loc; reflexul doar reține mișcarea curentă
+    reflex_layer.set_motion("L", use_speed)
     
-    # Roata stângă merge înapoi
-    safe_output_pwm(pwm_motor1_forward, False)
-    safe_output_pwm(pwm_motor1_backward, True, use_speed)
+    print(f"Viraj stânga cu viteza {use_speed}%")
     
-    # Roata dreaptă merge înainte
-    safe_output_pwm(pwm_motor2_forward, True, use_speed)
-    safe_output_pwm(pwm_motor2_backward, False)
+    # Roata stângă merge înapoi, roata dreaptă merge înainte
+    set_motors(0, use_speed, use_speed, 0)
 
 def turn_right(speed=None):
     """Viraj la dreapta cu viteza specificată - rotire diferențială"""
@@ -134,24 +201,22 @@ def turn_right(speed=None):
     
     use_speed = speed if speed is not None else motor_speed
     
-    print(f"Viraj dreapta cu viteza {use_speed}%")
+    # Virajele sunt pe loc; reflexul doar reține mișcarea curentă
+    reflex_layer.set_motion("R", use_speed)
     
-    # Roata stângă merge înainte
-    safe_output_pwm(pwm_motor1_forward, True, use_speed)
-    safe_output_pwm(pwm_motor1_backward, False)
+    print(f"Viraj dreapta cu viteza {use_speed}%")
     
-    # Roata dreaptă merge înapoi
-    safe_output_pwm(pwm_motor2_forward, False)
-    safe_output_pwm(pwm_motor2_backward, True, use_speed)
+    # Roata stângă merge înainte, roata dreaptă merge înapoi
+    set_motors(use_speed, 0, 0, use_speed)
 
 def stop():
     """Oprește toate motoarele"""
-    print("Stop")
-    
-    safe_output_pwm(pwm_motor1_forward, False)
-    safe_output_pwm(pwm_motor1_backward, False)
-    safe_output_pwm(pwm_motor2_forward, False)
-    safe_output_pwm(pwm_motor2_backward, False)
+    with motor_lock:
+        reflex_layer.set_motion("S", 0)
+        
+        print("Stop")
+        
+        set_motors(0, 0, 0, 0)
 
 def process_command(command):
     """
@@ -164,54 +229,90 @@ def process_command(command):
     """
     global motor_speed
     
-    try:
-        # Verifică dacă comanda include parametru de viteză
-        if ":" in command:
-            cmd, param = command.split(":", 1)
-            speed = int(param)
+    # Comenzile și reflexul nu se pot intercala
+    with motor_lock:
+        try:
+            # Verifică dacă comanda include parametru de viteză
+            if ":" in command:
+                cmd, param = command.split(":", 1)
+                speed = int(param)
             
-            # Limitează viteza la intervalul 0-100%
-            speed = max(0, min(100, speed))
+                # Limitează viteza la intervalul 0-100%
+                speed = max(0, min(100, speed))
             
-            # Setează viteza globală sau execută comanda cu viteza specificată
-            if cmd == "V":
-                motor_speed = speed
-                print(f"Viteza implicită setată la {speed}%")
-                return
-            elif cmd in "FBLRS":
-                command = cmd  # Folosește doar partea de comandă pentru switch-ul de mai jos
-                # Viteza va fi transmisă la funcțiile de control
+                # Setează viteza globală sau execută comanda cu viteza specificată
+                if cmd == "V":
+                    motor_speed = speed
+                    print(f"Viteza implicită setată la {speed}%")
+                    return
+                elif cmd in "FBLRS":
+                    command = cmd  # Folosește doar partea de comandă pentru switch-ul de mai jos
+                    # Viteza va fi transmisă la funcțiile de control
+                else:
+                    print(f"Comandă necunoscută: {command}")
+                    return
             else:
-                print(f"Comandă necunoscută: {command}")
-                return
-        else:
-            # Comanda nu include parametru de viteză, se va folosi viteza implicită
-            speed = None
+                # Comanda nu include parametru de viteză, se va folosi viteza implicită
+                speed = None
         
-        # Verificare suplimentară de siguranță
-        if not command or command not in "FBLRSV":
-            print(f'Comandă nerecunoscută: {command} - Oprire motoare pentru siguranță')
-            stop()
-            return
+            # Verificare suplimentară de siguranță
+            if not command or command not in "FBLRSV":
+                print(f'Comandă nerecunoscută: {command} - Oprire motoare pentru siguranță')
+                stop()
+                return
         
-        # Execută comanda
-        if command.startswith('F'):
-            forward(speed)
-        elif command.startswith('B'):
-            backward(speed)
-        elif command.startswith('L'):
-            turn_left(speed)
-        elif command.startswith('R'):
-            turn_right(speed)
-        elif command.startswith('S'):
-            stop()
-        else:
-            print(f"Comandă necunoscută: {command}")
-            stop()  # Oprire de siguranță
+            # Execută comanda
+            if command.startswith('F'):
+                forward(speed)
+            elif command.startswith('B'):
+                backward(speed)
+            elif command.startswith('L'):
+                turn_left(speed)
+            elif command.startswith('R'):
+                turn_right(speed)
+            elif command.startswith('S'):
+                stop()
+            else:
+                print(f"Comandă necunoscută: {command}")
+                stop()  # Oprire de siguranță
             
-    except Exception as e:
-        print(f"Eroare la procesarea comenzii: {e}")
-        stop()  # Oprire de siguranță în caz de eroare
+        except Exception as e:
+            print(f"Eroare la procesarea comenzii: {e}")
+            stop()  # Oprire de siguranță în caz de eroare
+
+# Reflexul de evitare a coliziunilor: primește citirile ultrasonice direct
+# de la sendmapdata.py și poate reduce viteza sau opri motoarele
+def reflex_drive(command, speed):
+    """Reaplică mersul curent cu viteza redusă de reflex"""
+    if command == "F":
+        forward(speed)
+    elif command == "B":
+        backward(speed)
+
+reflex_layer = reflex.ReflexLayer(
+    reflex_drive, stop,
+    reflex.load_config(REFLEX_CONFIG_FILE if os.path.exists(REFLEX_CONFIG_FILE) else None),
+    lock=motor_lock)
+
+reflex_listener = None
+
+def start_reflex():
+    """Pornește primirea citirilor de la sendmapdata.py pentru reflex"""
+    global reflex_listener
+    if reflex_listener is None:
+        reflex_listener = reflex.ReflexListener(reflex_layer)
+        reflex_listener.start()
+    return reflex_listener
+
+def stop_reflex():
+    """Oprește primirea citirilor pentru reflex și eliberează portul UDP"""
+    global reflex_listener
+    if reflex_listener is not None:
+        reflex_listener.close()
+        reflex_listener = None
+
+# Arbitrul păstrează doar ultima comandă de mers și o aplică la frecvență fixă
+command_arbiter = CommandArbiter(process_command)
 
 # Constante pentru definirea serviciului BLE
 BLUEZ_SERVICE_NAME = 'org.bluez'
@@ -414,8 +515,16 @@ class CommandCharacteristic(Characteristic):
             command = bytes(value).decode('utf-8')
             print('Comandă primită: %s' % command)
             
-            # Procesează comanda inclusiv parametrul de viteză dacă există
-            process_command(command)
+            # Setarea vitezei implicite nu atinge GPIO și nu trebuie pierdută;
+            # comenzile de mers trec prin arbitru, care păstrează doar ultima.
+            # Viteza implicită se fixează la primire, ca un "V" sosit imediat
+            # după să nu schimbe viteza unei comenzi încă neaplicate
+            if command.startswith("V"):
+                process_command(command)
+            elif command in ("F", "B", "L", "R"):
+                command_arbiter.submit(f"{command}:{motor_speed}")
+            else:
+                command_arbiter.submit(command)
             
         except Exception as e:
             print('Eroare la procesarea comenzii: %s' % e)
@@ -561,6 +670,12 @@ def main():
         stop()
         time.sleep(0.5)  # Pauză pentru stabilizare
         
+        # Pornește reflexul de evitare a coliziunilor
+        start_reflex()
+        
+        # Pornește tactul de acționare a motoarelor
+        command_arbiter.start()
+        
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
         
         bus = dbus.SystemBus()
@@ -632,6 +747,11 @@ def main():
             # Dezînregistrează advertisement-ul dacă există
             if 'ad_manager' in locals() and 'robot_advertisement' in locals():
                 ad_manager.UnregisterAdvertisement(robot_advertisement.get_path())
+            stop_reflex()
+            if command_arbiter.is_alive():
+                command_arbiter.close()
+                print(f"Statistici arbitru: {command_arbiter.stats()}, "
+                      f"scrieri PWM: {pwm_writes}, omise: {pwm_writes_skipped}")
             # Curăță resursele
             cleanup()
         except Exception as e:
@@ -0,0 +1,73 @@
+"""
+Corecția distorsiunii de mișcare pentru cadrele din sendmapdata.py.
+
+Cei patru senzori ultrasonici sunt citiți unul după altul, la zeci sau sute
+de milisecunde distanță, iar contorii Hall sunt citiți abia la sfârșitul
+cadrului. La viteză mare, citirile nu pot fi tratate ca simultane.
+
+deskew_frame() folosește momentele impulsurilor Hall ("hall_ticks") pentru a
+estima, prin interpolare, cât s-a deplasat robotul între fiecare citire și
+sfârșitul cadrului ("monotonic"), și adaugă fiecărei citiri câmpul "offset":
+poza senzorului în momentul citirii, (dx, dy, dtheta), în cadrul robotului
+de la sfârșitul cadrului. OccupancyGrid.integrate_scan() folosește acest
+offset dacă există.
+"""
+
+import math
+
+import numpy as np
+
+from occupancygrid import Odometry
+
+
+def ticks_after(tick_times, t):
+    """
+    Câte impulsuri (fracționar) au avut loc după momentul t.
+
+    Numărul cumulat de impulsuri este interpolat liniar între momentele lor,
+    ceea ce presupune viteză constantă între două impulsuri.
+    """
+    if len(tick_times) == 0:
+        return 0.0
+    counts = np.arange(1, len(tick_times) + 1, dtype=float)
+    before = np.interp(t, tick_times, counts, left=0.0, right=float(len(tick_times)))
+    return float(len(tick_times) - before)
+
+
+def relative_pose(left_ticks, right_ticks, left_sign, right_sign):
+    """Poza de la începutul unei deplasări, văzută din poza de la sfârșitul ei"""
+    dx, dy, dtheta = Odometry().update(left_ticks, right_ticks, left_sign, right_sign)
+
+    # Inversa transformării (dx, dy, dtheta)
+    cos_t, sin_t = math.cos(dtheta), math.sin(dtheta)
+    return (-(dx * cos_t + dy * sin_t),
+            -(-dx * sin_t + dy * cos_t),
+            -dtheta)
+
+
+def deskew_frame(frame, left_sign=1, right_sign=1):
+    """
+    Adaugă "offset" fiecărei citiri ultrasonice din cadru (modifică cadrul).
+
+    Parametri:
+    - frame: cadrul din collect_data(), cu "monotonic", "hall_ticks" și "t" pe citiri
+    - left_sign, right_sign: sensul roților în timpul cadrului, dacă e cunoscut
+
+    Cadrele fără timestamp-uri per citire sunt lăsate neschimbate.
+    """
+    ticks = frame.get("hall_ticks")
+    end_time = frame.get("monotonic")
+    if ticks is None or end_time is None:
+        return frame
+
+    left = [t for t in ticks.get("left_wheel", []) if t <= end_time]
+    right = [t for t in ticks.get("right_wheel", []) if t <= end_time]
+
+    for reading in frame.get("ultrasonic", []):
+        if "t" not in reading:
+            continue
+        reading["offset"] = relative_pose(ticks_after(left, reading["t"]),
+                                          ticks_after(right, reading["t"]),
+                                          left_sign, right_sign)
+    frame["deskewed"] = True
+    return frame
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Explorare autonomă bazată pe frontiere.
+
+Acest script:
+1. Primește datele de la sendmapdata.py și construiește harta de ocupare
+2. Găsește frontierele (celule libere vecine cu necunoscutul) vectorizat
+3. Planifică drumul cu A* peste o hartă de cost cu inflație precalculată
+4. Replanifică doar când schimbările hărții afectează drumul curent
+5. Trimite comenzi F/L/R/S prin process_command din carcontrolbt.py
+
+Căutarea A* este împărțită în felii de timp, astfel încât fiecare pas de
+planificare se termină într-o perioadă de telemetrie; robotul nu se oprește
+să „gândească”.
+
+Nu rulați simultan cu serverul BLE (carcontrolbt.py): ambele controlează
+aceleași pini PWM.
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import time
+
+import numpy as np
+import websockets
+
+from deskew import deskew_frame
+from occupancygrid import (CM_PER_TICK, WHEEL_BASE, OccupancyGrid, Odometry, distance_field,
+                           update_distance_field, normalize_angle, wheel_signs)
+from scanmatcher import ScanMatcher
+
+# Perioada de telemetrie a sendmapdata.py; planificarea trebuie să încapă în ea
+TELEMETRY_PERIOD = 0.1
+PLANNING_BUDGET = 0.5 * TELEMETRY_PERIOD  # restul perioadei rămâne pentru hartă
+
+# Geometria robotului și inflația (cm)
+ROBOT_RADIUS = 10.0
+INFLATION_RADIUS = 24.0
+
+# Costuri (multiplicatori ai lungimii pasului)
+INSCRIBED_COST = 50.0   # celule în care robotul ar atinge un obstacol
+INFLATION_COST = 10.0   # costul maxim în zona de inflație, scade cu distanța
+UNKNOWN_COST = 2.0      # traversarea necunoscutului e permisă, dar penalizată
+
+# Frontiere
+FRONTIER_BLOCK = 5          # celulele frontierei se grupează în blocuri de 5x5
+MIN_FRONTIER_SIZE = 3       # celule minime de frontieră într-un bloc
+FRONTIER_SIZE_WEIGHT = 2.0  # cm câștigați pentru fiecare celulă de frontieră
+MIN_GOAL_DISTANCE = 20.0    # cm; frontierele de lângă robot se văd rotindu-l
+
+# Urmărirea drumului
+WAYPOINT_REACHED = 6.0   # cm
+LOOKAHEAD = 15.0         # cm
+TURN_THRESHOLD = 0.5     # rad; peste această eroare robotul se rotește pe loc
+TURN_STEP = 2 * CM_PER_TICK / WHEEL_BASE  # rad; rotația la un impuls pe fiecare roată
+FORWARD_SPEED = 60       # %
+TURN_SPEED = 50          # %
+# Reflexul poate opri robotul fără ca explorarea să afle; dacă roțile nu s-au
+# mișcat atâtea cadre sub o comandă de mers, comanda este retrimisă
+STALL_FRAMES = 10
+
+# Corectarea odometriei prin potrivirea citirilor cu harta (scanmatcher.py).
+# Oprită implicit: cu 2 impulsuri pe rotație, poza din odometrie rămâne în
+# urmă cu până la jumătate de pas (≈5 cm, ≈40° la viraj), mult peste fereastra
+# de căutare, iar potrivirea mărește eroarea (vezi scanmatcher_benchmark.py)
+SCAN_MATCHING = False
+
+# Semnul impulsurilor Hall pentru fiecare comandă (stânga, dreapta)
+WHEEL_SIGNS = {
+    "F": (1, 1),
+    "B": (-1, -1),
+    "L": (-1, 1),
+    "R": (1, -1),
+    "S": (1, 1),
+}
+
+# Vecinii pentru A* (drept și diagonal) cu lungimea pasului
+NEIGHBOURS = [(-1, 0, 1.0), (1, 0, 1.0), (0, -1, 1.0), (0, 1, 1.0),
+              (-1, -1, math.sqrt(2)), (-1, 1, math.sqrt(2)),
+              (1, -1, math.sqrt(2)), (1, 1, math.sqrt(2))]
+
+
+def find_frontiers(free, unknown):
+    """Masca celulelor libere care au cel puțin un vecin necunoscut (4-vecinătate)"""
+    padded = np.pad(unknown, 1, constant_values=False)
+    near_unknown = (padded[:-2, 1:-1] | padded[2:, 1:-1] |
+                    padded[1:-1, :-2] | padded[1:-1, 2:])
+    return free & near_unknown
+
+
+def frontier_candidates(frontier, block=FRONTIER_BLOCK, min_size=MIN_FRONTIER_SIZE):
+    """
+    Grupează frontiera în blocuri și întoarce un candidat per bloc.
+
+    Rezultatul: (rânduri, coloane, dimensiuni) ale celulei de frontieră cea mai
+    apropiată de centrul fiecărui bloc suficient de mare.
+    """
+    rows, cols = np.nonzero(frontier)
+    if rows.size == 0:
+        return rows, cols, rows
+    blocks_per_row = frontier.shape[1] // block + 1
+    block_ids = (rows // block) * blocks_per_row + (cols // block)
+    ids, inverse, sizes = np.unique(block_ids, return_inverse=True, return_counts=True)
+
+    # Centrul fiecărui bloc, ca medie a celulelor lui
+    center_r = np.bincount(inverse, weights=rows) / sizes
+    center_c = np.bincount(inverse, weights=cols) / sizes
+
+    # Pentru fiecare bloc, celula cea mai apropiată de centru (e chiar pe frontieră)
+    offset = (rows - center_r[inverse]) ** 2 + (cols - center_c[inverse]) ** 2
+    order = np.lexsort((offset, inverse))
+    first = order[np.searchsorted(inverse[order], np.arange(ids.size))]
+
+    keep = sizes >= min_size
+    return rows[first][keep], cols[first][keep], sizes[keep]
+
+
+class CostMap:
+    """
+    Harta de cost pentru A*, derivată din harta de ocupare.
+
+    Inflația (distanța la obstacole) se recalculează doar în regiunea în care
+    s-a schimbat clasificarea celulelor, extinsă cu raza de inflație.
+    """
+
+    def __init__(self, grid):
+        self.resolution = grid.resolution
+        self.inflation_cells = INFLATION_RADIUS / grid.resolution
+        self.robot_cells = ROBOT_RADIUS / grid.resolution
+        self.state = None
+        self.distance = None
+        self.cost = None
+        self.update(grid)
+
+    def classify(self, grid):
+        # 0 = necunoscut, 1 = liber, 2 = ocupat
+        state = np.zeros(grid.log_odds.shape, dtype=np.int8)
+        state[grid.free_mask()] = 1
+        state[grid.occupied_mask()] = 2
+        return state
+
+    def update(self, grid):
+        """Actualizează costurile; întoarce (r0, r1, c0, c1) al regiunii schimbate sau None"""
+        state = self.classify(grid)
+        if self.state is None:
+            self.state = state
+            self.distance = distance_field(state == 2, self.inflation_cells)
+            self.cost = self.compute_cost(state, self.distance)
+            return (0, state.shape[0], 0, state.shape[1])
+
+        changed = update_distance_field(
+            self.distance, state == 2, state != self.state, self.inflation_cells)
+        self.state = state
+        if changed is None:
+            return None
+
+        r0, r1, c0, c1 = changed
+        self.cost[r0:r1, c0:c1] = self.compute_cost(
+            state[r0:r1, c0:c1], self.distance[r0:r1, c0:c1])
+        return changed
+
+    def compute_cost(self, state, distance):
+        cost = np.ones(state.shape, dtype=np.float32)
+        cost[state == 0] = UNKNOWN_COST
+
+        # Costul de inflație scade liniar de la raza robotului la raza de inflație
+        span = max(self.inflation_cells - self.robot_cells, 1e-6)
+        falloff = np.clip((self.inflation_cells - distance) / span, 0.0, 1.0)
+        cost += INFLATION_COST * falloff
+        cost[distance <= self.robot_cells] = INSCRIBED_COST
+        cost[state == 2] = np.inf
+        return cost
+
+
+class AStarSearch:
+    """
+    Căutare A* care poate fi întreruptă și reluată.
+
+    run() lucrează până la termenul limită și întoarce "found", "failed" sau
+    "pending"; starea căutării se păstrează între apeluri. Căutarea are copia
+    ei a costurilor, actualizată între felii prin update_costs().
+    """
+
+    def __init__(self, cost, start, goal):
+        self.cost = cost.copy()
+        self.shape = cost.shape
+        self.start = start
+        self.goal = goal
+        size = cost.size
+        self.g = np.full(size, np.inf)
+        self.parent = np.full(size, -1, dtype=np.int64)
+        self.closed = np.zeros(size, dtype=bool)
+        start_index = start[0] * self.shape[1] + start[1]
+        self.g[start_index] = 0.0
+        self.open = [(self.heuristic(start), 0.0, start_index)]
+        self.path = None
+
+    def heuristic(self, cell):
+        # Distanța octilă, admisibilă deoarece costul minim al unui pas este 1
+        dr = abs(cell[0] - self.goal[0])
+        dc = abs(cell[1] - self.goal[1])
+        return (dr + dc) + (math.sqrt(2) - 2) * min(dr, dc)
+
+    def run(self, deadline):
+        rows, cols = self.shape
+        goal_index = self.goal[0] * cols + self.goal[1]
+        cost = self.cost.ravel()
+        expansions = 0
+
+        while self.open:
+            expansions += 1
+            if expansions % 128 == 0 and time.monotonic() > deadline:
+                return "pending"
+
+            _, g, index = heapq.heappop(self.open)
+            if self.closed[index] or cost[index] == np.inf:
+                # Celula poate fi devenit obstacol după ce a intrat în coadă
+                continue
+            self.closed[index] = True
+            if index == goal_index:
+                self.path = self.reconstruct(index)
+                return "found"
+
+            r, c = divmod(index, cols)
+            for dr, dc, step in NEIGHBOURS:
+                nr, nc = r + dr, c + dc
+                if nr < 0 or nr >= rows or nc < 0 or nc >= cols:
+                    continue
+                n_index = nr * cols + nc
+                if self.closed[n_index] or cost[n_index] == np.inf:
+                    continue
+                new_g = g + step * cost[n_index]
+                if new_g < self.g[n_index]:
+                    self.g[n_index] = new_g
+                    self.parent[n_index] = index
+                    heapq.heappush(self.open, (new_g + self.heuristic((nr, nc)), new_g, n_index))
+
+        return "failed"
+
+    def update_costs(self, cost, region):
+        """
+        Preia costurile noi din regiunea (r0, r1, c0, c1).
+
+        Celulele încă neexpandate primesc costul nou. Dacă o celulă deja
+        expandată a devenit mai scumpă, drumurile prin ea nu mai sunt valide
+        și se întoarce False; scăderile de cost nu invalidează căutarea.
+        """
+        r0, r1, c0, c1 = region
+        old = self.cost[r0:r1, c0:c1]
+        new = cost[r0:r1, c0:c1]
+        closed = self.closed.reshape(self.shape)[r0:r1, c0:c1]
+        if np.any(closed & (new > old)):
+            return False
+        old[...] = new
+        return True
+
+    def reconstruct(self, index):
+        cols = self.shape[1]
+        path = []
+        while index != -1:
+            path.append(divmod(int(index), cols))
+            index = self.parent[index]
+        path.reverse()
+        return path
+
+
+class Explorer:
+    """Alege frontiere, planifică drumul și decide comanda pentru motoare"""
+
+    def __init__(self, grid=None, pose=(0.0, 0.0, 0.0), scan_matching=None):
+        self.grid = grid if grid is not None else OccupancyGrid()
+        self.odometry = Odometry(*pose)
+        self.costmap = CostMap(self.grid)
+        if scan_matching is None:
+            scan_matching = SCAN_MATCHING
+        self.matcher = ScanMatcher(self.grid) if scan_matching else None
+        self.frontier = np.zeros(self.grid.log_odds.shape, dtype=bool)
+        self.search = None
+        self.path = None
+        self.goal = None
+        self.unreachable = set()
+        self.last_command = "S"
+        self.replan = False
+        self.stalled_frames = 0
+        self.exhausted = False
+        self.finished = False
+
+    def integrate(self, frame):
+        """Aplică un cadru de la sendmapdata.py: odometrie și citiri ultrasonice"""
+        hall = frame.get("hall_sensors", {})
+        # Sensul roților din telemetrie; cadrele vechi folosesc comanda trimisă
+        left_sign, right_sign = wheel_signs(frame, WHEEL_SIGNS[self.last_command.split(":", 1)[0]])
+        if not frame.get("deskewed"):
+            # Aici sensul roților e cunoscut din comanda trimisă
+            deskew_frame(frame, left_sign, right_sign)
+        self.odometry.update(hall.get("left_wheel", 0), hall.get("right_wheel", 0),
+                             left_sign, right_sign)
+        if hall.get("left_wheel", 0) or hall.get("right_wheel", 0):
+            self.stalled_frames = 0
+        else:
+            self.stalled_frames += 1
+
+        if self.matcher is not None:
+            # Fereastra de citiri recente corectează deriva odometriei
+            self.matcher.add_frame(frame, self.odometry.pose())
+            corrected = self.matcher.match(self.odometry.pose())
+            if corrected is not None:
+                x, y, theta = corrected
+                self.odometry.x, self.odometry.y = x, y
+                self.odometry.theta = normalize_angle(theta)
+
+        self.grid.integrate_scan(self.odometry.pose(), frame.get("ultrasonic", []))
+
+    def robot_cell(self):
+        x, y, _ = self.odometry.pose()
+        row, col = self.grid.world_to_cell(x, y)
+        return int(row), int(col)
+
+    def update_plan(self, deadline):
+        """Actualizează harta de cost și drumul, fără a depăși termenul limită"""
+        changed = self.costmap.update(self.grid)
+        if changed is not None:
+            self.frontier = find_frontiers(self.costmap.state == 1, self.costmap.state == 0)
+            self.invalidate_if_affected(changed)
+
+        # Cât timp căutarea rulează, robotul continuă pe drumul vechi
+        if self.search is None and (self.path is None or self.replan):
+            self.replan = False
+            self.start_search()
+        if self.search is not None:
+            result = self.search.run(deadline)
+            if result == "found":
+                self.path = self.from_robot(self.search.path)
+                self.search = None
+            elif result == "failed":
+                self.unreachable.add(self.goal)
+                self.goal = None
+                self.search = None
+                self.replan = True
+
+    def from_robot(self, path):
+        """Drumul nou pornește din celula de start; robotul s-a mișcat între timp"""
+        row, col = self.robot_cell()
+        cells = np.array(path)
+        nearest = int(np.argmin(np.hypot(cells[:, 0] - row, cells[:, 1] - col)))
+        return path[nearest:]
+
+    def invalidate_if_affected(self, changed):
+        """Replanificare incrementală: se renunță la drum doar dacă schimbarea îl atinge"""
+        r0, r1, c0, c1 = changed
+
+        if self.goal is not None and not self.frontier[self.goal]:
+            # Ținta a fost explorată între timp; robotul merge pe drumul vechi
+            # până când căutarea găsește o țintă nouă
+            self.search = None
+            self.goal = None
+            self.replan = True
+        elif self.search is not None and not self.search.update_costs(self.costmap.cost, changed):
+            # Schimbarea atinge celule deja expandate; căutarea se reia cu aceeași țintă
+            self.search = None
+            self.replan = True
+
+        if self.path is None:
+            return
+
+        path = np.array(self.path)
+        inside = ((path[:, 0] >= r0) & (path[:, 0] < r1) &
+                  (path[:, 1] >= c0) & (path[:, 1] < c1))
+        if inside.any():
+            blocked = np.zeros(len(path), dtype=bool)
+            blocked[inside] = self.costmap.cost[path[inside, 0], path[inside, 1]] >= INSCRIBED_COST
+            if blocked.any():
+                # Drumul se păstrează doar până înainte de obstacol
+                self.path = self.path[:int(np.argmax(blocked))] or None
+                self.replan = True
+
+    def start_search(self):
+        start = self.robot_cell()
+        if not self.grid.in_bounds(*start):
+            # Poza estimată a ieșit din hartă; nu există drum de planificat
+            return
+        if self.goal is None or not self.frontier[self.goal]:
+            self.goal = self.choose_goal(start)
+        if self.goal is None:
+            # Explorarea e gata doar dacă nu mai rămâne nicio frontieră sau toate
+            # sunt inaccesibile; fragmentele prea mici nu contează ca frontiere
+            # încă, robotul se rotește ca să le extindă
+            self.finished = self.exhausted or (
+                bool((self.costmap.state == 1).any()) and not self.frontier.any())
+            return
+        self.finished = False
+        self.search = AStarSearch(self.costmap.cost, start, self.goal)
+
+    def choose_goal(self, start):
+        self.exhausted = False
+        rows, cols, sizes = frontier_candidates(self.frontier)
+        if rows.size == 0:
+            return None
+
+        # Ținte în care robotul nu încape sau care s-au dovedit inaccesibile sunt excluse
+        distance = np.hypot(rows - start[0], cols - start[1]) * self.grid.resolution
+        far = distance >= MIN_GOAL_DISTANCE
+        if not far.any():
+            return None
+        usable = far & (self.costmap.cost[rows, cols] < INSCRIBED_COST)
+        if self.unreachable:
+            blocked = np.array([(r, c) in self.unreachable for r, c in zip(rows, cols)])
+            usable &= ~blocked
+        if not usable.any():
+            self.exhausted = True
+            return None
+        rows, cols, sizes = rows[usable], cols[usable], sizes[usable]
+
+        score = distance[usable] - FRONTIER_SIZE_WEIGHT * sizes
+        best = int(np.argmin(score))
+        return int(rows[best]), int(cols[best])
+
+    def next_command(self):
+        """Comanda pentru motoare care urmărește drumul curent"""
+        if self.finished:
+            return "S"
+        if not self.path:
+            if self.goal is None and self.search is None:
+                # Încă nicio frontieră: robotul se rotește pe loc ca să vadă în jur
+                return f"L:{TURN_SPEED}"
+            return "S"
+
+        x, y, theta = self.odometry.pose()
+        path_x, path_y = self.grid.cell_to_world(*np.array(self.path).T)
+        distance = np.hypot(path_x - x, path_y - y)
+
+        # Se renunță la punctele deja atinse
+        reached = np.nonzero(distance < WAYPOINT_REACHED)[0]
+        if reached.size:
+            self.path = self.path[reached[-1] + 1:]
+            path_x, path_y = path_x[reached[-1] + 1:], path_y[reached[-1] + 1:]
+            distance = distance[reached[-1] + 1:]
+            if not self.path:
+                # Ținta a fost atinsă; se alege alta la pasul următor
+                self.path = None
+                self.goal = None
+                return "S"
+
+        ahead = np.nonzero(distance >= LOOKAHEAD)[0]
+        target = ahead[0] if ahead.size else len(self.path) - 1
+        error = normalize_angle(math.atan2(path_y[target] - y, path_x[target] - x) - theta)
+
+        # Odometria vede rotația în pași de TURN_STEP; un prag mai mic decât
+        # jumătate de pas ar face robotul să oscileze L/R în jurul direcției
+        threshold = max(TURN_THRESHOLD, TURN_STEP / 2)
+        if error > threshold:
+            return f"L:{TURN_SPEED}"
+        if error < -threshold:
+            return f"R:{TURN_SPEED}"
+        return f"F:{FORWARD_SPEED}"
+
+    def step(self, frame, send_command):
+        """Un pas complet: hartă, planificare în bugetul de timp, comandă"""
+        started = time.monotonic()
+        self.integrate(frame)
+        self.update_plan(started + PLANNING_BUDGET)
+
+        command = self.next_command()
+        stalled = command != "S" and self.stalled_frames >= STALL_FRAMES
+        if command != self.last_command or stalled:
+            send_command(command)
+            self.stalled_frames = 0
+        self.last_command = command
+        return time.monotonic() - started
+
+
+async def explore(url, send_command, scan_matching=SCAN_MATCHING):
+    explorer = Explorer(scan_matching=scan_matching)
+    async with websockets.connect(url) as websocket:
+        print(f"Conectat la {url}, încep explorarea")
+        async for message in websocket:
+            elapsed = explorer.step(json.loads(message), send_command)
+            if elapsed > TELEMETRY_PERIOD:
+                print(f"Atenție: pasul a durat {elapsed * 1000:.1f} ms")
+            if explorer.finished:
+                print("Nu mai există frontiere accesibile - explorare terminată")
+                send_command("S")
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explorare autonomă bazată pe frontiere")
+    parser.add_argument("--url", default="ws://127.0.0.1:8765",
+                        help="adresa serverului sendmapdata.py")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="afișează comenzile fără a porni motoarele")
+    parser.add_argument("--scan-matching", action="store_true", default=SCAN_MATCHING,
+                        help="corectează odometria prin scan matching (necesită senzori "
+                             "Hall cu rezoluție fină, vezi scanmatcher_benchmark.py)")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        send_command = lambda command: print(f"Comandă: {command}")
+        cleanup = lambda: None
+    else:
+        # Importul inițializează GPIO și PWM pentru motoare
+        from carcontrolbt import process_command, stop, cleanup, start_reflex, stop_reflex
+        send_command = process_command
+        # Reflexul de evitare a coliziunilor funcționează și în explorare
+        start_reflex()
+
+    try:
+        asyncio.run(explore(args.url, send_command, args.scan_matching))
+    except KeyboardInterrupt:
+        print("Explorare oprită de utilizator")
+    finally:
+        if not args.dry_run:
+            stop_reflex()
+            stop()
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
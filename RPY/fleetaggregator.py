@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Agregator pentru o flotă de roboți în aceeași arenă.
+
+Acest script:
+1. Menține conexiuni WebSocket (cu reconectare automată) la serverele
+   sendmapdata.py ale tuturor roboților
+2. Normalizează timestamp-urile fiecărui robot la ceasul agregatorului
+3. Integrează datele fiecărui robot și combină hărțile într-o hartă globală,
+   într-un pool de procese în fundal
+4. Servește harta combinată vizualizatoarelor pe un singur port
+5. Poate porni roboți simulați pentru teste de încărcare
+
+Configurația flotei este un fișier JSON de forma:
+[
+    {"name": "car1", "url": "ws://192.168.1.10:8765", "pose": [0, 0, 0]},
+    {"name": "car2", "url": "ws://192.168.1.11:8765", "pose": [50, 0, 3.14]}
+]
+unde "pose" este poziția de start (cm, cm, rad) în cadrul comun al arenei.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import websockets
+
+from deskew import deskew_frame
+from occupancygrid import (OccupancyGrid, Odometry, SENSOR_ANGLES, MIN_RANGE,
+                           MAX_RANGE, CM_PER_TICK, merge_log_odds, wheel_signs)
+
+# Porturi
+VIEWER_PORT = 8766          # vizualizatoarele se conectează aici
+SIMULATION_BASE_PORT = 9000  # roboții simulați ascultă pe 9000, 9001, ...
+
+# Perioade (secunde)
+MERGE_PERIOD = 0.5   # cât de des se recalculează harta globală
+VIEW_PERIOD = 0.5    # cât de des se trimite harta vizualizatoarelor
+TELEMETRY_PERIOD = 0.1  # perioada de trimitere din sendmapdata.py
+
+# Reconectare
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+MAX_CONCURRENT_CONNECTS = 8  # limitează furtuna de conexiuni la pornire
+
+# Câte cadre se păstrează pentru un robot între două combinări ale hărții
+MAX_PENDING_FRAMES = 200
+
+# Fereastra pentru estimarea diferenței de ceas (număr de cadre)
+CLOCK_WINDOW = 100
+
+# Corecția distorsiunii de mișcare (deskew.py); se aplică doar cadrelor care
+# au sensul roților în telemetrie, altfel un viraj pe loc ar fi corectat greșit
+DESKEW = True
+
+
+class ClockSync:
+    """
+    Estimează diferența dintre ceasul robotului și ceasul agregatorului.
+
+    Offset-ul este minimul lui (timp_primire - timp_robot) pe o fereastră
+    glisantă: cadrele cu cea mai mică întârziere de rețea dau estimarea
+    cea mai bună, iar fereastra permite urmărirea derivei ceasului.
+    """
+
+    def __init__(self, window=CLOCK_WINDOW):
+        self.samples = collections.deque(maxlen=window)
+        self.offset = None
+
+    def update(self, robot_time, local_time):
+        self.samples.append(local_time - robot_time)
+        self.offset = min(self.samples)
+        return self.offset
+
+    def to_local(self, robot_time):
+        if self.offset is None:
+            return robot_time
+        return robot_time + self.offset
+
+
+class RobotLink:
+    """Conexiunea către un robot, cu reconectare automată și buffer de cadre"""
+
+    def __init__(self, name, url, pose=(0.0, 0.0, 0.0)):
+        self.name = name
+        self.url = url
+        self.pose = tuple(pose)
+        self.log_odds = OccupancyGrid().log_odds
+        self.clock = ClockSync()
+        self.clock_source = None
+        self.pending = collections.deque(maxlen=MAX_PENDING_FRAMES)
+        self.connected = False
+        self.last_seen = None
+        self.frames_received = 0
+        self.reconnects = 0
+
+    async def run(self, connect_slots):
+        """Bucla de conectare; nu se termină decât la anulare"""
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            try:
+                async with connect_slots:
+                    websocket = await websockets.connect(
+                        self.url, open_timeout=5, ping_interval=5, ping_timeout=5)
+                print(f"[{self.name}] Conectat la {self.url}")
+                self.connected = True
+                delay = RECONNECT_MIN_DELAY
+                try:
+                    async for message in websocket:
+                        self.receive(message)
+                finally:
+                    self.connected = False
+                    await websocket.close()
+                print(f"[{self.name}] Conexiune închisă")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{self.name}] Eroare conexiune: {e}")
+
+            # Backoff exponențial cu jitter, ca roboții să nu se reconecteze simultan
+            self.reconnects += 1
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def receive(self, message):
+        local_time = time.time()
+        try:
+            frame = json.loads(message)
+            # Ceasul monoton al robotului nu sare la corecțiile NTP; cadrele
+            # simulate sau de la versiuni vechi au doar "timestamp"
+            source = "monotonic" if "monotonic" in frame else "timestamp"
+            robot_time = float(frame[source])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[{self.name}] Cadru invalid: {e}")
+            return
+
+        if source != self.clock_source:
+            # Offset-urile celor două ceasuri nu se pot compara
+            self.clock = ClockSync()
+            self.clock_source = source
+        self.clock.update(robot_time, local_time)
+        frame["fleet_timestamp"] = self.clock.to_local(robot_time)
+        self.pending.append(frame)
+        self.last_seen = local_time
+        self.frames_received += 1
+
+    def take_frames(self):
+        """Scoate cadrele acumulate, ordonate după timpul normalizat"""
+        frames = list(self.pending)
+        self.pending.clear()
+        frames.sort(key=lambda f: f["fleet_timestamp"])
+        return frames
+
+    def status(self):
+        x, y, theta = self.pose
+        return {
+            "name": self.name,
+            "pose": [x, y, theta],
+            "connected": self.connected,
+            "last_seen": self.last_seen,
+            "clock_offset": self.clock.offset,
+            "frames": self.frames_received,
+        }
+
+
+# Funcții executate în procesele din pool (trebuie să fie la nivel de modul)
+
+def integrate_frames(log_odds, pose, frames):
+    """Aplică odometria și citirile ultrasonice ale unui robot pe harta lui"""
+    grid = OccupancyGrid(data=log_odds)
+    odometry = Odometry(*pose)
+    for frame in frames:
+        hall = frame.get("hall_sensors", {})
+        # Virajele sunt pe loc, deci sensul roților vine din telemetrie
+        left_sign, right_sign = wheel_signs(frame)
+        if DESKEW and "wheel_signs" in frame and not frame.get("deskewed"):
+            deskew_frame(frame, left_sign, right_sign)
+        odometry.update(hall.get("left_wheel", 0), hall.get("right_wheel", 0),
+                        left_sign, right_sign)
+        grid.integrate_scan(odometry.pose(), frame.get("ultrasonic", []))
+    return grid.log_odds, odometry.pose()
+
+
+def merge_maps(grids):
+    """Combină hărțile roboților și pregătește mesajul pentru vizualizare"""
+    grid = OccupancyGrid(data=merge_log_odds(grids))
+    return grid.to_message()
+
+
+class FleetAggregator:
+    """Coordonează conexiunile, combinarea hărților și vizualizatoarele"""
+
+    def __init__(self, robots, workers=None):
+        self.links = [RobotLink(r["name"], r["url"], r.get("pose", (0, 0, 0)))
+                      for r in robots]
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.viewers = set()
+        self.map_message = None
+        self.merge_count = 0
+        self.merge_time = 0.0
+
+    async def merge_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = time.monotonic()
+
+            # Fiecare robot își integrează cadrele în paralel, în pool
+            jobs = []
+            for link in self.links:
+                frames = link.take_frames()
+                if frames:
+                    job = loop.run_in_executor(
+                        self.pool, integrate_frames, link.log_odds, link.pose, frames)
+                    jobs.append((link, job))
+            for link, job in jobs:
+                try:
+                    link.log_odds, link.pose = await job
+                except Exception as e:
+                    print(f"[{link.name}] Eroare la integrarea hărții: {e}")
+                    self.restart_pool_if_broken(e)
+
+            if jobs or self.map_message is None:
+                try:
+                    message = await loop.run_in_executor(
+                        self.pool, merge_maps, [link.log_odds for link in self.links])
+                except Exception as e:
+                    print(f"Eroare la combinarea hărților: {e}")
+                    self.restart_pool_if_broken(e)
+                else:
+                    message["type"] = "map"
+                    message["timestamp"] = time.time()
+                    message["robots"] = [link.status() for link in self.links]
+                    self.map_message = json.dumps(message)
+
+            elapsed = time.monotonic() - started
+            self.merge_count += 1
+            self.merge_time += elapsed
+            await asyncio.sleep(max(0.0, MERGE_PERIOD - elapsed))
+
+    def restart_pool_if_broken(self, error):
+        """Un proces mort din pool îl face inutilizabil; se pornește unul nou"""
+        if isinstance(error, BrokenProcessPool):
+            print("Pool-ul de procese s-a oprit neașteptat, repornire...")
+            self.pool.shutdown(wait=False)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def viewer_handler(self, websocket, path=None):
+        print("Vizualizator conectat")
+        self.viewers.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.viewers.discard(websocket)
+            print("Vizualizator deconectat")
+
+    async def send_to_viewer(self, websocket, message):
+        try:
+            # Un vizualizator lent nu trebuie să blocheze restul
+            await asyncio.wait_for(websocket.send(message), timeout=VIEW_PERIOD)
+        except Exception:
+            self.viewers.discard(websocket)
+
+    async def broadcast_loop(self):
+        while True:
+            if self.map_message is not None and self.viewers:
+                await asyncio.gather(*[self.send_to_viewer(v, self.map_message)
+                                       for v in list(self.viewers)])
+            await asyncio.sleep(VIEW_PERIOD)
+
+    def print_stats(self, elapsed):
+        frames = sum(link.frames_received for link in self.links)
+        connected = sum(link.connected for link in self.links)
+        merge_ms = 1000 * self.merge_time / max(self.merge_count, 1)
+        print(f"Roboți conectați: {connected}/{len(self.links)}, "
+              f"cadre/s: {frames / elapsed:.1f}, "
+              f"timp mediu combinare: {merge_ms:.1f} ms, "
+              f"vizualizatoare: {len(self.viewers)}")
+
+    async def run(self, port=VIEWER_PORT, duration=None):
+        connect_slots = asyncio.Semaphore(MAX_CONCURRENT_CONNECTS)
+        tasks = [asyncio.create_task(link.run(connect_slots)) for link in self.links]
+        tasks.append(asyncio.create_task(self.merge_loop()))
+        tasks.append(asyncio.create_task(self.broadcast_loop()))
+        server = await websockets.serve(self.viewer_handler, "0.0.0.0", port)
+        print(f"Harta combinată disponibilă la ws://IP_ADDRESS:{port}")
+
+        started = time.monotonic()
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                await asyncio.sleep(5)
+                self.print_stats(time.monotonic() - started)
+        finally:
+            server.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.pool.shutdown()
+
+
+# Roboți simulați pentru teste de încărcare
+
+SIMULATION_ARENA = 250.0  # cm, latura arenei pătrate
+
+
+def simulated_range(x, y, angle, half_size=SIMULATION_ARENA / 2):
+    """Distanța de la (x, y) pe direcția angle până la peretele arenei"""
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    distances = []
+    if cos_a > 1e-9:
+        distances.append((half_size - x) / cos_a)
+    elif cos_a < -1e-9:
+        distances.append((-half_size - x) / cos_a)
+    if sin_a > 1e-9:
+        distances.append((half_size - y) / sin_a)
+    elif sin_a < -1e-9:
+        distances.append((-half_size - y) / sin_a)
+    return min(distances)
+
+
+class SimulatedRobot:
+    """
+    Robot simulat care trimite cadre în formatul collect_data().
+
+    Merge înainte și, când se apropie de perete, se rotește pe loc ca
+    robotul real (roțile în sensuri opuse). Ceasul are un offset aleator,
+    pentru a testa normalizarea timestamp-urilor.
+    """
+
+    def __init__(self, pose):
+        self.x, self.y, self.theta = pose
+        self.odometry = Odometry(*pose)
+        self.clock_offset = random.uniform(-30.0, 30.0)
+        self.tick_remainder = [0.0, 0.0]
+
+    def step(self, dt):
+        # Viraj la stânga pe loc, ca turn_left() din carcontrolbt.py
+        front = simulated_range(self.x, self.y, self.theta)
+        if front < 40:
+            signs = (-1, 1)
+        else:
+            signs = (1, 1)
+        left_cm = right_cm = 20.0 * dt
+
+        # Senzorii Hall numără impulsuri întregi; restul se păstrează pentru pasul următor
+        ticks = []
+        for i, cm in enumerate((left_cm, right_cm)):
+            self.tick_remainder[i] += cm / CM_PER_TICK
+            whole = int(self.tick_remainder[i])
+            self.tick_remainder[i] -= whole
+            ticks.append(whole)
+
+        # Robotul se mișcă exact cât arată impulsurile numărate
+        self.x, self.y, self.theta = self.odometry.update(ticks[0], ticks[1], *signs)
+
+        ultrasonic = []
+        for direction, angle in SENSOR_ANGLES.items():
+            distance = simulated_range(self.x, self.y, self.theta + angle)
+            distance += random.gauss(0, 1.0)
+            if MIN_RANGE <= distance <= MAX_RANGE:
+                ultrasonic.append({"direction": direction, "distance": distance})
+
+        return {
+            "timestamp": time.time() + self.clock_offset,
+            "ultrasonic": ultrasonic,
+            "hall_sensors": {"left_wheel": ticks[0], "right_wheel": ticks[1]},
+            "wheel_signs": {"left_wheel": signs[0], "right_wheel": signs[1]},
+        }
+
+    async def handler(self, websocket, path=None):
+        try:
+            while True:
+                await asyncio.sleep(random.uniform(0, 0.02))  # jitter de rețea
+                await websocket.send(json.dumps(self.step(TELEMETRY_PERIOD)))
+                await asyncio.sleep(TELEMETRY_PERIOD)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def start_simulated_robots(count, base_port=SIMULATION_BASE_PORT):
+    """Pornește count roboți simulați și întoarce configurația flotei"""
+    robots = []
+    for i in range(count):
+        limit = SIMULATION_ARENA / 2 - 30
+        pose = (random.uniform(-limit, limit), random.uniform(-limit, limit),
+                random.uniform(-math.pi, math.pi))
+        robot = SimulatedRobot(pose)
+        await websockets.serve(robot.handler, "127.0.0.1", base_port + i)
+        robots.append({"name": f"sim{i}", "url": f"ws://127.0.0.1:{base_port + i}",
+                       "pose": pose})
+    print(f"Am pornit {count} roboți simulați pe porturile "
+          f"{base_port}-{base_port + count - 1}")
+    return robots
+
+
+async def main_async(args):
+    if args.simulate:
+        robots = await start_simulated_robots(args.simulate)
+    else:
+        with open(args.config) as f:
+            robots = json.load(f)
+
+    aggregator = FleetAggregator(robots, workers=args.workers)
+    await aggregator.run(port=args.port, duration=args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agregator hărți pentru flotă de roboți")
+    parser.add_argument("--config", default="fleet.json",
+                        help="fișierul JSON cu roboții flotei")
+    parser.add_argument("--simulate", type=int, default=0,
+                        help="pornește N roboți simulați în loc de configurație")
+    parser.add_argument("--port", type=int, default=VIEWER_PORT,
+                        help="portul pentru vizualizatoare")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="numărul de procese pentru combinarea hărților")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="oprește după N secunde (pentru teste de încărcare)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("Oprire agregator...")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Hartă de ocupare (occupancy grid) și odometrie pentru robot.
+
+Modulul nu atinge GPIO, deci poate fi importat atât pe Raspberry Pi cât și
+pe un PC (agregator, vizualizare, simulare).
+
+Convenții:
+- coordonatele lumii sunt în cm, unghiurile în radiani (0 = axa X, sens trigonometric)
+- harta stochează log-odds: 0 = necunoscut, > 0 ocupat, < 0 liber
+- direcțiile senzorilor corespund cu ULTRASONIC_PINS din sendmapdata.py
+"""
+
+import base64
+import math
+
+import numpy as np
+
+# Unghiul fiecărui senzor ultrasonic față de direcția de mers a robotului
+SENSOR_ANGLES = {
+    "front": 0.0,
+    "left": math.pi / 2,
+    "back": math.pi,
+    "right": -math.pi / 2,
+}
+
+# Limitele senzorilor (aceleași ca filtrarea din measure_distance)
+MIN_RANGE = 2.0     # cm
+MAX_RANGE = 100.0   # cm
+
+# Parametri hartă
+GRID_RESOLUTION = 2.0   # cm per celulă
+GRID_SIZE = 300.0       # cm pe latură, centrat în origine
+
+# Valori log-odds pentru actualizarea celulelor
+LOG_ODDS_OCCUPIED = 0.85
+LOG_ODDS_FREE = -0.4
+LOG_ODDS_LIMIT = 5.0
+
+# Praguri pentru clasificarea celulelor (log-odds)
+OCCUPIED_THRESHOLD = 0.5
+FREE_THRESHOLD = -0.5
+
+# Parametri odometrie - ajustați după roțile și magneții robotului
+WHEEL_DIAMETER = 6.5    # cm
+TICKS_PER_REV = 2       # callback-ul Hall numără ambele fronturi, un magnet per roată
+WHEEL_BASE = 14.0       # cm, distanța dintre roți
+CM_PER_TICK = math.pi * WHEEL_DIAMETER / TICKS_PER_REV
+
+
+def normalize_angle(angle):
+    """Aduce unghiul în intervalul [-pi, pi)"""
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+class Odometry:
+    """
+    Odometrie diferențială pe baza contorilor Hall.
+
+    Senzorii Hall nu dau sensul de rotație, așa că semnul fiecărei roți
+    trebuie furnizat de cine știe ce comandă a fost trimisă motoarelor
+    (telemetria îl conține în "wheel_signs", vezi wheel_signs(); implicit
+    se presupune mers înainte).
+    """
+
+    def __init__(self, x=0.0, y=0.0, theta=0.0):
+        self.x = x
+        self.y = y
+        self.theta = theta
+
+    def update(self, left_ticks, right_ticks, left_sign=1, right_sign=1):
+        """Integrează un pas de odometrie și întoarce poza nouă"""
+        d_left = left_sign * left_ticks * CM_PER_TICK
+        d_right = right_sign * right_ticks * CM_PER_TICK
+        d_center = (d_left + d_right) / 2
+        d_theta = (d_right - d_left) / WHEEL_BASE
+
+        # Integrare la unghiul mediu al pasului
+        mid_theta = self.theta + d_theta / 2
+        self.x += d_center * math.cos(mid_theta)
+        self.y += d_center * math.sin(mid_theta)
+        self.theta = normalize_angle(self.theta + d_theta)
+        return self.pose()
+
+    def pose(self):
+        return (self.x, self.y, self.theta)
+
+
+def wheel_signs(frame, default=(1, 1)):
+    """Sensul roților dintr-un cadru ("wheel_signs"), sau default pentru cadrele vechi"""
+    signs = frame.get("wheel_signs")
+    if signs is None:
+        return default
+    return (signs.get("left_wheel", default[0]), signs.get("right_wheel", default[1]))
+
+
+class OccupancyGrid:
+    """Hartă de ocupare în log-odds, actualizată cu citirile ultrasonice"""
+
+    def __init__(self, size=GRID_SIZE, resolution=GRID_RESOLUTION, data=None):
+        self.resolution = resolution
+        self.cells = int(round(size / resolution))
+        self.size = self.cells * resolution
+        self.origin = -self.size / 2  # colțul stânga-jos, în cm
+        if data is None:
+            data = np.zeros((self.cells, self.cells), dtype=np.float32)
+        self.log_odds = data
+
+    def world_to_cell(self, x, y):
+        """Transformă coordonate (scalare sau array-uri) în indici (rând, coloană)"""
+        col = np.floor((np.asarray(x) - self.origin) / self.resolution).astype(np.int64)
+        row = np.floor((np.asarray(y) - self.origin) / self.resolution).astype(np.int64)
+        return row, col
+
+    def cell_to_world(self, row, col):
+        """Centrul celulei (rând, coloană) în coordonate ale lumii"""
+        x = self.origin + (np.asarray(col) + 0.5) * self.resolution
+        y = self.origin + (np.asarray(row) + 0.5) * self.resolution
+        return x, y
+
+    def in_bounds(self, row, col):
+        return (row >= 0) & (row < self.cells) & (col >= 0) & (col < self.cells)
+
+    def integrate_scan(self, pose, ultrasonic):
+        """
+        Integrează citirile unui cadru în hartă.
+
+        Parametri:
+        - pose: (x, y, theta) al robotului în momentul citirii
+        - ultrasonic: lista de {"direction", "distance"} din collect_data();
+          dacă o citire are "offset" (vezi deskew.py), raza pornește din poza
+          robotului în momentul citirii, nu din pose
+        """
+        step = self.resolution / 2
+
+        for reading in ultrasonic:
+            angle = SENSOR_ANGLES.get(reading.get("direction"))
+            distance = reading.get("distance", -1)
+            if angle is None or distance < MIN_RANGE:
+                continue
+
+            x, y, theta = pose
+            if "offset" in reading:
+                dx, dy, dtheta = reading["offset"]
+                x += dx * math.cos(theta) - dy * math.sin(theta)
+                y += dx * math.sin(theta) + dy * math.cos(theta)
+                theta += dtheta
+
+            beam = theta + angle
+            cos_b, sin_b = math.cos(beam), math.sin(beam)
+
+            # Celulele de pe rază, până înainte de obstacol, sunt libere
+            ts = np.arange(0.0, max(distance - self.resolution, 0.0), step)
+            rows, cols = self.world_to_cell(x + ts * cos_b, y + ts * sin_b)
+            mask = self.in_bounds(rows, cols)
+            free = np.unique(rows[mask] * self.cells + cols[mask])
+            self.log_odds.ravel()[free] += LOG_ODDS_FREE
+
+            # Capătul razei este ocupat doar dacă senzorul a văzut ceva
+            if distance < MAX_RANGE:
+                row, col = self.world_to_cell(x + distance * cos_b, y + distance * sin_b)
+                if self.in_bounds(row, col):
+                    self.log_odds[row, col] += LOG_ODDS_OCCUPIED
+
+        np.clip(self.log_odds, -LOG_ODDS_LIMIT, LOG_ODDS_LIMIT, out=self.log_odds)
+
+    def occupied_mask(self):
+        return self.log_odds > OCCUPIED_THRESHOLD
+
+    def free_mask(self):
+        return self.log_odds < FREE_THRESHOLD
+
+    def unknown_mask(self):
+        return (self.log_odds >= FREE_THRESHOLD) & (self.log_odds <= OCCUPIED_THRESHOLD)
+
+    def probabilities(self):
+        """Probabilitatea de ocupare pentru fiecare celulă"""
+        return 1.0 / (1.0 + np.exp(-self.log_odds))
+
+    def to_message(self):
+        """
+        Serializează harta pentru vizualizare.
+
+        Celulele sunt trimise ca int8 în base64, rând cu rând de jos în sus:
+        -1 = necunoscut, 0..100 = probabilitate de ocupare în procente.
+        """
+        cells = np.round(self.probabilities() * 100).astype(np.int8)
+        cells[self.log_odds == 0] = -1
+        return {
+            "resolution": self.resolution,
+            "width": self.cells,
+            "height": self.cells,
+            "origin": [self.origin, self.origin],
+            "encoding": "int8-base64",
+            "cells": base64.b64encode(cells.tobytes()).decode("ascii"),
+        }
+
+
+def distance_field(occupied, max_distance):
+    """
+    Distanța (în celule) de la fiecare celulă la cel mai apropiat obstacol.
+
+    Se calculează exact până la max_distance, prin deplasări vectorizate ale
+    măștii de obstacole; celulele mai îndepărtate primesc max_distance.
+    """
+    rows, cols = occupied.shape
+    radius = int(math.ceil(max_distance))
+    padded = np.pad(occupied, radius, constant_values=False)
+    field = np.full(occupied.shape, max_distance, dtype=np.float32)
+
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            d = math.hypot(dx, dy)
+            if d >= max_distance:
+                continue
+            shifted = padded[radius + dy:radius + dy + rows, radius + dx:radius + dx + cols]
+            field[shifted & (field > d)] = d
+    return field
+
+
+def update_distance_field(field, occupied, changed, max_distance):
+    """
+    Actualizează distance_field() doar în jurul celulelor schimbate.
+
+    Parametri:
+    - field: câmpul de distanțe existent, modificat pe loc
+    - occupied: masca nouă a obstacolelor
+    - changed: masca celulelor a căror ocupare s-a schimbat
+
+    Întoarce regiunea actualizată (r0, r1, c0, c1) sau None dacă nu s-a
+    schimbat nimic.
+    """
+    rows, cols = np.nonzero(changed)
+    if rows.size == 0:
+        return None
+    height, width = occupied.shape
+
+    # O schimbare afectează distanțele până la max_distance în jurul ei
+    margin = int(math.ceil(max_distance))
+    r0, r1 = max(rows.min() - margin, 0), min(rows.max() + margin + 1, height)
+    c0, c1 = max(cols.min() - margin, 0), min(cols.max() + margin + 1, width)
+
+    # Se calculează pe o fereastră cu încă o margine, ca obstacolele din afara
+    # regiunii să fie văzute corect
+    w0, w1 = max(r0 - margin, 0), min(r1 + margin, height)
+    v0, v1 = max(c0 - margin, 0), min(c1 + margin, width)
+    window = distance_field(occupied[w0:w1, v0:v1], max_distance)
+    field[r0:r1, c0:c1] = window[r0 - w0:r1 - w0, c0 - v0:c1 - v0]
+    return (r0, r1, c0, c1)
+
+
+def merge_log_odds(grids):
+    """
+    Combină mai multe hărți în log-odds (aceeași dimensiune și același cadru).
+
+    Observațiile roboților sunt considerate independente, deci log-odds se adună.
+    """
+    merged = np.zeros_like(grids[0])
+    for grid in grids:
+        merged += grid
+    np.clip(merged, -LOG_ODDS_LIMIT, LOG_ODDS_LIMIT, out=merged)
+    return merged
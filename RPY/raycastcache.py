@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Tabel precalculat de distanțe așteptate pentru senzorii ultrasonici.
+
+Simularea citirilor și ponderarea particulelor la localizare au nevoie de
+ray-casting pe hartă pentru fiecare direcție din ULTRASONIC_PINS. În loc să
+se traseze raze la fiecare interogare, RaycastCache precalculează distanța
+până la primul obstacol pentru fiecare celulă (x, y) și fiecare unghi
+discretizat theta, iar interogarea devine o simplă indexare.
+
+- tabelul este un array memory-mapped (.npy), deci nu trebuie încărcat
+  integral în memorie și poate fi refolosit între rulări
+- construcția este împărțită pe grupuri de rânduri, în paralel pe toate
+  nucleele procesorului, cu un singur pool de procese pe durata tabelului
+- la schimbarea hărții se recalculează doar celulele aflate în raza
+  senzorului față de celulele schimbate
+
+Numărul de unghiuri este multiplu de 4, astfel încât cele patru direcții
+ale senzorilor (față, stânga, spate, dreapta) să cadă exact pe unghiuri din
+tabel: aceeași coloană servește toate direcțiile.
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from occupancygrid import OccupancyGrid, SENSOR_ANGLES, MIN_RANGE, MAX_RANGE
+
+ANGLE_BINS = 72             # 5 grade per unghi
+ROWS_PER_TASK = 8           # câte rânduri calculează un proces la o sarcină
+CACHE_FILE = "raycast_cache.npy"
+
+
+def cast_cells(occupied, resolution, rows, cols, angle_bins, max_range=MAX_RANGE):
+    """
+    Distanțele de la centrele celulelor (rows[i], cols[i]) până la primul
+    obstacol, pe fiecare unghi; max_range dacă nu există obstacol.
+
+    Razele sunt eșantionate la jumătate de celulă, vectorizat pe celule,
+    unghiuri și pași, câte un rând de hartă odată.
+    """
+    height, width = occupied.shape
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    angles = np.arange(angle_bins) * (2 * math.pi / angle_bins)
+    steps = np.arange(resolution / 2, max_range + resolution / 2, resolution / 2)
+
+    # Razele pornesc din centrul celulei, deci celula fiecărui eșantion este
+    # celula de start plus un decalaj care nu depinde de celulă: (unghiuri, pași)
+    offset_col = np.floor(0.5 + np.cos(angles)[:, None] * steps[None, :] / resolution).astype(np.int64)
+    offset_row = np.floor(0.5 + np.sin(angles)[:, None] * steps[None, :] / resolution).astype(np.int64)
+
+    result = np.empty((len(rows), angle_bins), dtype=np.float32)
+    for start in range(0, len(rows), width):
+        end = start + width
+        # (celule, unghiuri, pași)
+        sample_col = cols[start:end, None, None] + offset_col[None]
+        sample_row = rows[start:end, None, None] + offset_row[None]
+        inside = (sample_row >= 0) & (sample_row < height) & (sample_col >= 0) & (sample_col < width)
+        hit = inside & occupied[np.clip(sample_row, 0, height - 1), np.clip(sample_col, 0, width - 1)]
+
+        first = hit.argmax(axis=-1)
+        distance = steps[first]
+        distance[~hit.any(axis=-1)] = max_range
+        result[start:end] = distance
+    return result
+
+
+def affected_cells(changed, radius):
+    """
+    Masca celulelor aflate la cel mult radius celule de o celulă schimbată.
+
+    Fiecare celulă schimbată marchează un disc, rând cu rând, ca intervale
+    de coloane; intervalele se adună într-un tablou de diferențe.
+    """
+    height, width = changed.shape
+    rows, cols = np.nonzero(changed)
+    dr = np.arange(-radius, radius + 1)
+    half = np.floor(np.sqrt(radius ** 2 - dr ** 2)).astype(np.int64)
+
+    # (celule schimbate, rânduri ale discului)
+    disc_rows = rows[:, None] + dr[None]
+    starts = np.clip(cols[:, None] - half[None], 0, width)
+    ends = np.clip(cols[:, None] + half[None] + 1, 0, width)
+    valid = (disc_rows >= 0) & (disc_rows < height)
+
+    marks = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(marks, (disc_rows[valid], starts[valid]), 1)
+    np.add.at(marks, (disc_rows[valid], ends[valid]), -1)
+    return np.cumsum(marks, axis=1)[:, :width] > 0
+
+
+def cast_ray(grid, occupied, x, y, angle, max_range=MAX_RANGE):
+    """Distanța până la primul obstacol pe o singură rază (fără tabel)"""
+    steps = np.arange(grid.resolution / 2, max_range + grid.resolution / 2, grid.resolution / 2)
+    rows, cols = grid.world_to_cell(x + steps * math.cos(angle), y + steps * math.sin(angle))
+    inside = grid.in_bounds(rows, cols)
+    hit = np.zeros(steps.shape, dtype=bool)
+    hit[inside] = occupied[rows[inside], cols[inside]]
+    if not hit.any():
+        return max_range
+    return float(steps[hit.argmax()])
+
+
+def build_task(args):
+    """Sarcina unui proces din pool: calculează celule și le scrie direct în fișier"""
+    path, occupied, resolution, rows, cols, angle_bins = args
+    table = np.lib.format.open_memmap(path, mode="r+")
+    table[rows, cols] = cast_cells(occupied, resolution, rows, cols, angle_bins)
+    table.flush()
+    del table
+    return len(rows)
+
+
+class RaycastCache:
+    """
+    Distanțele așteptate pentru o hartă, indexate după (rând, coloană, unghi).
+
+    Parametri:
+    - grid: OccupancyGrid pentru care se construiește tabelul
+    - path: fișierul .npy memory-mapped; metadatele stau în path + ".json"
+      și masca obstacolelor folosită în path + ".occupied.npy"
+    - workers: numărul de procese pentru construcție (implicit toate nucleele)
+
+    Pool-ul de procese este creat la prima construcție și păstrat pentru
+    actualizări; close() îl oprește.
+    """
+
+    def __init__(self, grid, path=CACHE_FILE, angle_bins=ANGLE_BINS, workers=None):
+        if angle_bins % 4 != 0:
+            raise ValueError("angle_bins trebuie să fie multiplu de 4")
+        self.grid = grid
+        self.path = path
+        self.angle_bins = angle_bins
+        self.bin_width = 2 * math.pi / angle_bins
+        self.workers = workers or os.cpu_count()
+        self.occupied = None
+        self.table = None
+        self.pool = None
+
+        if not self.load():
+            self.build()
+
+    def metadata(self):
+        return {
+            "resolution": self.grid.resolution,
+            "origin": self.grid.origin,
+            "cells": self.grid.cells,
+            "angle_bins": self.angle_bins,
+            "max_range": MAX_RANGE,
+        }
+
+    def load(self):
+        """Refolosește un tabel existent dacă a fost construit pentru aceeași hartă"""
+        try:
+            with open(self.path + ".json") as f:
+                if json.load(f) != self.metadata():
+                    return False
+            self.occupied = np.load(self.path + ".occupied.npy")
+            self.table = np.lib.format.open_memmap(self.path, mode="r+")
+        except (OSError, ValueError):
+            return False
+
+        # Harta s-ar fi putut schimba de la ultima rulare
+        self.update()
+        return True
+
+    def build(self):
+        """Construiește tot tabelul, în paralel"""
+        self.occupied = self.grid.occupied_mask()
+        shape = (self.grid.cells, self.grid.cells, self.angle_bins)
+        table = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32, shape=shape)
+        del table
+
+        self.compute_cells(np.ones(shape[:2], dtype=bool))
+        self.save_metadata()
+        self.table = np.lib.format.open_memmap(self.path, mode="r+")
+
+    def compute_cells(self, mask):
+        """Recalculează celulele din mască, câte ROWS_PER_TASK rânduri pe sarcină"""
+        rows, cols = np.nonzero(mask)
+        bounds = np.searchsorted(rows, np.arange(0, self.grid.cells + ROWS_PER_TASK, ROWS_PER_TASK))
+        tasks = [(self.path, self.occupied, self.grid.resolution,
+                  rows[start:end], cols[start:end], self.angle_bins)
+                 for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        if self.workers > 1 and len(tasks) > 1:
+            if self.pool is None:
+                self.pool = Pool(self.workers)
+            for _ in self.pool.imap_unordered(build_task, tasks):
+                pass
+        else:
+            for task in tasks:
+                build_task(task)
+
+    def close(self):
+        """Oprește procesele din pool și eliberează tabelul"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.table is not None:
+            self.table.flush()
+            self.table = None
+
+    def save_metadata(self):
+        np.save(self.path + ".occupied.npy", self.occupied)
+        with open(self.path + ".json", "w") as f:
+            json.dump(self.metadata(), f)
+
+    def update(self):
+        """
+        Reconstruiește doar celulele afectate de schimbările hărții.
+
+        O celulă ocupată nou sau eliberată poate schimba doar razele care
+        pornesc la cel mult MAX_RANGE de ea (plus o celulă, pentru că raza
+        poate atinge marginea celulei). Întoarce masca celulelor recalculate
+        sau None.
+        """
+        occupied = self.grid.occupied_mask()
+        changed = occupied != self.occupied
+        if not changed.any():
+            return None
+
+        self.occupied = occupied
+        radius = int(math.ceil(MAX_RANGE / self.grid.resolution)) + 1
+        mask = affected_cells(changed, radius)
+
+        if self.table is not None:
+            self.table.flush()
+        self.compute_cells(mask)
+        self.save_metadata()
+        return mask
+
+    def angle_bin(self, theta):
+        return np.round(np.asarray(theta) / self.bin_width).astype(np.int64) % self.angle_bins
+
+    def lookup(self, x, y, theta, direction="front"):
+        """
+        Distanțele așteptate (cm) pentru poze date ca scalare sau array-uri.
+
+        Pozițiile din afara hărții întorc MAX_RANGE.
+        """
+        row, col = self.grid.world_to_cell(x, y)
+        angle = self.angle_bin(np.asarray(theta) + SENSOR_ANGLES[direction])
+        inside = self.grid.in_bounds(row, col)
+        last = self.grid.cells - 1
+        values = self.table[np.clip(row, 0, last), np.clip(col, 0, last), angle]
+        return np.where(inside, values, MAX_RANGE)
+
+    def expected_ranges(self, x, y, theta):
+        """Distanțele așteptate pentru toți senzorii, ca dicționar direcție -> cm"""
+        return {direction: float(self.lookup(x, y, theta, direction))
+                for direction in SENSOR_ANGLES}
+
+    def simulate_readings(self, pose, noise=1.0):
+        """Citiri simulate în formatul collect_data(), fără ray-casting"""
+        readings = []
+        for direction, distance in self.expected_ranges(*pose).items():
+            distance += np.random.normal(0.0, noise)
+            if MIN_RANGE <= distance < MAX_RANGE:
+                readings.append({"direction": direction, "distance": distance})
+        return readings
+
+    def likelihood(self, particles, ultrasonic, sigma=3.0):
+        """
+        Verosimilitatea citirilor pentru fiecare particulă.
+
+        particles este un array (N, 3) cu (x, y, theta); citirile lipsă
+        (nimic în rază) sunt comparate cu MAX_RANGE.
+        """
+        particles = np.asarray(particles, dtype=float)
+        measured = {direction: MAX_RANGE for direction in SENSOR_ANGLES}
+        for reading in ultrasonic:
+            if reading.get("direction") in measured and reading.get("distance", -1) > 0:
+                measured[reading["direction"]] = reading["distance"]
+
+        log_weight = np.zeros(len(particles))
+        for direction, distance in measured.items():
+            expected = self.lookup(particles[:, 0], particles[:, 1], particles[:, 2], direction)
+            log_weight -= 0.5 * ((expected - distance) / sigma) ** 2
+        return np.exp(log_weight - log_weight.max())
+
+
+def benchmark(workers):
+    """Compară ray-casting-ul direct cu interogarea tabelului pe o arenă pătrată"""
+    grid = OccupancyGrid()
+    occupied = np.zeros(grid.log_odds.shape, dtype=bool)
+    occupied[[15, -16], 15:-15] = True
+    occupied[15:-15, [15, -16]] = True
+    grid.log_odds[occupied] = 1.0
+
+    path = "raycast_benchmark.npy"
+    started = time.monotonic()
+    cache = RaycastCache(grid, path=path, workers=workers)
+    print(f"Construcție tabel: {time.monotonic() - started:.2f} s cu {cache.workers} procese")
+
+    # Un obstacol nou: doar regiunea din jurul lui se recalculează
+    grid.log_odds[70:74, 70:74] = 1.0
+    started = time.monotonic()
+    updated = cache.update()
+    print(f"Actualizare incrementală ({updated.sum()} celule): {time.monotonic() - started:.2f} s")
+
+    count = 2000
+    half = grid.size / 2 - 40
+    particles = np.column_stack((np.random.uniform(-half, half, count),
+                                 np.random.uniform(-half, half, count),
+                                 np.random.uniform(-math.pi, math.pi, count)))
+
+    started = time.monotonic()
+    for x, y, theta in particles:
+        for angle in SENSOR_ANGLES.values():
+            cast_ray(grid, cache.occupied, x, y, theta + angle)
+    direct = time.monotonic() - started
+
+    started = time.monotonic()
+    for direction in SENSOR_ANGLES:
+        cache.lookup(particles[:, 0], particles[:, 1], particles[:, 2], direction)
+    cached = time.monotonic() - started
+
+    print(f"{count} particule x {len(SENSOR_ANGLES)} senzori: ray-casting {direct * 1000:.1f} ms, "
+          f"tabel {cached * 1000:.2f} ms ({direct / max(cached, 1e-9):.0f}x mai rapid)")
+
+    cache.close()
+    for suffix in ("", ".json", ".occupied.npy"):
+        os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tabel precalculat de distanțe pentru senzori")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="numărul de procese pentru construcție")
+    args = parser.parse_args()
+    benchmark(args.workers)
+
+
+if __name__ == '__main__':
+    main()
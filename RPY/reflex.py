@@ -0,0 +1,299 @@
+"""
+Reflex de evitare a coliziunilor, executat pe robot.
+
+Citirile ultrasonice ajung la controlul motoarelor direct, fără drumul
+Wi-Fi -> client -> BLE. Pentru fiecare citire se verifică senzorul din
+direcția de mers și, dacă viteza curentă nu permite oprirea înainte de
+obstacol, viteza este limitată sau motoarele sunt oprite.
+
+sendmapdata.py și carcontrolbt.py rulează în procese separate, așa că
+citirile sunt trimise prin UDP pe localhost (ReflexPublisher ->
+ReflexListener), imediat după fiecare măsurătoare. Timpii sunt luați cu
+time.monotonic(), care pe Linux este comun tuturor proceselor, deci
+latența reflexului se poate măsura de la citire până la intervenție.
+
+Pe același canal, în sens invers, carcontrolbt.py anunță sensul roților la
+fiecare schimbare a motoarelor (MotionPublisher -> MotionListener), pentru
+ca sendmapdata.py să poată trimite în telemetrie semnul impulsurilor Hall.
+
+Configurația se poate suprascrie dintr-un fișier JSON cu aceleași chei ca
+DEFAULT_CONFIG.
+"""
+
+import collections
+import json
+import math
+import socket
+import threading
+import time
+
+REFLEX_HOST = "127.0.0.1"
+REFLEX_PORT = 8767
+MOTION_PORT = 8768
+
+# Senzorul care contează pentru fiecare comandă; virajele sunt pe loc
+COMMAND_SENSORS = {
+    "F": "front",
+    "B": "back",
+}
+
+DEFAULT_CONFIG = {
+    "enabled": True,
+    "max_speed_cm_s": 50.0,      # viteza robotului la 100% PWM
+    "deceleration_cm_s2": 150.0,  # frânare după oprirea motoarelor
+    "reaction_time": 0.15,       # s; include perioada dintre două citiri ale aceluiași senzor
+    "safety_margin": 8.0,        # cm păstrați față de obstacol
+    "stop_distance": 12.0,       # cm; sub această distanță motoarele se opresc oricum
+    "min_speed": 25,             # %; sub această valoare motoarele nu mai pornesc
+    "max_reading_age": 0.5,      # s; citirile mai vechi sunt ignorate
+    "log_file": None,            # fișier JSON lines pentru intervenții
+    "max_interventions": 1000,   # câte intervenții se păstrează în memorie
+}
+
+
+def load_config(path=None):
+    """Configurația implicită, suprascrisă cu valorile din fișierul JSON (dacă există)"""
+    config = dict(DEFAULT_CONFIG)
+    if path is not None:
+        with open(path) as f:
+            config.update(json.load(f))
+    return config
+
+
+class ReflexLayer:
+    """
+    Limitează viteza în funcție de distanța până la obstacolul din direcția de mers.
+
+    Parametri:
+    - drive: funcție (comandă, viteză) care aplică o viteză redusă pentru "F"/"B"
+    - stop: funcție care oprește motoarele
+    - lock: lacăt comun cu procesarea comenzilor, ca reflexul să nu se
+      intercaleze cu o comandă în curs
+    """
+
+    def __init__(self, drive, stop, config=None, lock=None):
+        self.config = config if config is not None else load_config()
+        self.drive = drive
+        self.stop = stop
+        self.lock = lock if lock is not None else threading.RLock()
+        self.command = "S"
+        self.speed = 0
+        self.readings = {}  # direcție -> (distanță sau None, timp monotonic)
+        self.interventions = collections.deque(maxlen=self.config["max_interventions"])
+
+    def allowed_speed(self, distance):
+        """Viteza maximă (%) cu care robotul se poate opri înainte de obstacol"""
+        config = self.config
+        if distance is None:
+            return 100
+        room = distance - config["safety_margin"]
+        if distance <= config["stop_distance"] or room <= 0:
+            return 0
+
+        # v * t_reacție + v^2 / (2a) = spațiu disponibil, rezolvat pentru v
+        a = config["deceleration_cm_s2"]
+        t = config["reaction_time"]
+        v = -a * t + math.sqrt((a * t) ** 2 + 2 * a * room)
+        speed = int(100 * v / config["max_speed_cm_s"])
+        if speed < config["min_speed"]:
+            return 0
+        return min(speed, 100)
+
+    def current_distance(self, command, now=None):
+        direction = COMMAND_SENSORS.get(command)
+        if direction is None or direction not in self.readings:
+            return None
+        distance, timestamp = self.readings[direction]
+        now = time.monotonic() if now is None else now
+        if now - timestamp > self.config["max_reading_age"]:
+            return None
+        return distance
+
+    def set_motion(self, command, speed):
+        """
+        Înregistrează mișcarea curentă, pentru ca citirile următoare să poată
+        fi comparate cu ea. Virajele și oprirea o apelează direct, fără limitare.
+        """
+        self.command, self.speed = command, speed
+
+    def limit_speed(self, command, speed):
+        """Apelată de mersul înainte/înapoi înainte de a scrie PWM; întoarce viteza permisă"""
+        if not self.config["enabled"]:
+            self.set_motion(command, speed)
+            return speed
+
+        distance = self.current_distance(command)
+        allowed = min(speed, self.allowed_speed(distance))
+        if allowed < speed:
+            self.record(command, COMMAND_SENSORS[command], distance, speed, allowed,
+                        "command", time.monotonic())
+        self.set_motion(command, allowed)
+        return allowed
+
+    def on_reading(self, direction, distance, timestamp=None):
+        """
+        Procesează o citire ultrasonică: distance None sau -1 = nimic în rază,
+        0 = obstacol mai aproape decât poate măsura senzorul (oprire).
+
+        Întoarce True dacă reflexul a intervenit.
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if distance is not None and distance < 0:
+            distance = None
+        self.readings[direction] = (distance, timestamp)
+        if not self.config["enabled"]:
+            return False
+
+        with self.lock:
+            command, speed = self.command, self.speed
+            if COMMAND_SENSORS.get(command) != direction or speed <= 0:
+                return False
+
+            allowed = self.allowed_speed(distance)
+            if allowed >= speed:
+                return False
+
+            if allowed == 0:
+                self.stop()
+                self.set_motion("S", 0)
+            else:
+                self.drive(command, allowed)
+                self.set_motion(command, allowed)
+
+        self.record(command, direction, distance, speed, allowed, "reading", timestamp)
+        return True
+
+    def record(self, command, direction, distance, speed, allowed, source, timestamp):
+        now = time.monotonic()
+        intervention = {
+            "time": time.time(),
+            "source": source,
+            "command": command,
+            "direction": direction,
+            "distance": distance,
+            "speed": speed,
+            "allowed": allowed,
+            "action": "stop" if allowed == 0 else "limit",
+            "latency_ms": (now - timestamp) * 1000,
+        }
+        self.interventions.append(intervention)
+        print(f"Reflex: {intervention['action']} {command} {speed}% -> {allowed}% "
+              f"(obstacol {direction} la {distance} cm, "
+              f"{intervention['latency_ms']:.2f} ms)")
+
+        if self.config["log_file"]:
+            try:
+                with open(self.config["log_file"], "a") as f:
+                    f.write(json.dumps(intervention) + "\n")
+            except OSError as e:
+                print(f"Eroare la scrierea jurnalului reflex: {e}")
+
+
+class ReflexPublisher:
+    """Trimite fiecare citire ultrasonică către reflexul din procesul motoarelor"""
+
+    def __init__(self, host=REFLEX_HOST, port=REFLEX_PORT):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def publish(self, direction, distance, timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        message = json.dumps({
+            "direction": direction,
+            "distance": distance,
+            "t": timestamp,
+        })
+        try:
+            self.sock.sendto(message.encode("utf-8"), self.address)
+        except OSError:
+            # Nimeni nu ascultă sau bufferul e plin; citirea următoare va ajunge
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpListener(threading.Thread):
+    """Fir de execuție care primește mesaje JSON pe localhost și le trece lui handle()"""
+
+    def __init__(self, host, port):
+        threading.Thread.__init__(self, daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.running = True
+
+    def handle(self, message):
+        raise NotImplementedError
+
+    def run(self):
+        while self.running:
+            try:
+                data, _ = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self.handle(json.loads(data.decode("utf-8")))
+            except Exception as e:
+                print(f"Eroare la mesajul UDP de pe portul {self.sock.getsockname()[1]}: {e}")
+
+    def close(self):
+        self.running = False
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=1.0)
+        self.sock.close()
+
+
+class ReflexListener(UdpListener):
+    """Primește citirile ultrasonice și le trece reflexului"""
+
+    def __init__(self, layer, host=REFLEX_HOST, port=REFLEX_PORT):
+        UdpListener.__init__(self, host, port)
+        self.layer = layer
+
+    def handle(self, reading):
+        self.layer.on_reading(reading["direction"], reading["distance"], reading["t"])
+
+
+class MotionPublisher:
+    """Anunță sensul roților (-1, 0, 1 pentru stânga și dreapta) la fiecare scriere a motoarelor"""
+
+    def __init__(self, host=REFLEX_HOST, port=MOTION_PORT):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def publish(self, left, right, timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        message = json.dumps({"left": left, "right": right, "t": timestamp})
+        try:
+            self.sock.sendto(message.encode("utf-8"), self.address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class MotionListener(UdpListener):
+    """
+    Păstrează sensul curent al fiecărei roți, pentru semnul impulsurilor Hall.
+
+    O roată oprită (0) păstrează ultimul sens: impulsurile de după oprirea
+    motoarelor vin din inerție, în același sens.
+    """
+
+    def __init__(self, host=REFLEX_HOST, port=MOTION_PORT):
+        UdpListener.__init__(self, host, port)
+        self.signs = (1, 1)
+
+    def handle(self, message):
+        left, right = self.signs
+        if message["left"] != 0:
+            left = 1 if message["left"] > 0 else -1
+        if message["right"] != 0:
+            right = 1 if message["right"] > 0 else -1
+        self.signs = (left, right)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark pentru reflexul de evitare a coliziunilor, în simulare.
+
+Un robot simulat merge înainte spre un perete; senzorii sunt citiți în
+aceeași ordine și cu aceleași pauze ca în sendmapdata.py, iar citirile
+ajung la ReflexLayer fie prin UDP (ca pe robot), fie direct. Se măsoară
+latența de la citire până la oprirea motoarelor și distanța rămasă până
+la perete după frânare.
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+
+import reflex
+
+SENSOR_ORDER = ["front", "right", "back", "left"]
+SENSOR_GAP = 0.01            # pauza dintre senzori din read_all_ultrasonic()
+SPEED_OF_SOUND = 34300.0     # cm/s
+BENCHMARK_PORT = reflex.REFLEX_PORT + 100  # nu interferează cu robotul real
+
+
+class SimulatedCar:
+    """Poziția robotului pe o axă, în timp real, după comenzile reflexului"""
+
+    def __init__(self, config, speed, wall_distance):
+        self.config = config
+        self.speed = speed
+        self.wall = wall_distance
+        self.position = 0.0
+        self.last_update = time.monotonic()
+        self.stop_time = None
+        self.braking_distance = 0.0
+        self.lock = threading.Lock()
+
+    def velocity(self):
+        return self.config["max_speed_cm_s"] * self.speed / 100
+
+    def advance(self):
+        with self.lock:
+            now = time.monotonic()
+            self.position += self.velocity() * (now - self.last_update)
+            self.last_update = now
+            return self.wall - self.position
+
+    def drive(self, command, speed):
+        self.advance()
+        with self.lock:
+            self.speed = speed
+
+    def stop(self):
+        self.advance()
+        with self.lock:
+            self.stop_time = time.monotonic()
+            self.braking_distance = self.velocity() ** 2 / (2 * self.config["deceleration_cm_s2"])
+            self.speed = 0
+
+
+def run_trial(config, speed, wall_distance, use_udp):
+    car = SimulatedCar(config, speed, wall_distance)
+    layer = reflex.ReflexLayer(car.drive, car.stop, config)
+    layer.limit_speed("F", speed)
+
+    if use_udp:
+        listener = reflex.ReflexListener(layer, port=BENCHMARK_PORT)
+        listener.start()
+        publisher = reflex.ReflexPublisher(port=BENCHMARK_PORT)
+        deliver = publisher.publish
+    else:
+        deliver = layer.on_reading
+
+    try:
+        deadline = time.monotonic() + 10
+        while car.stop_time is None and time.monotonic() < deadline:
+            for direction in SENSOR_ORDER:
+                gap = car.advance() if direction == "front" else 50.0
+                # Ecoul durează cât drumul dus-întors al sunetului
+                time.sleep(2 * max(gap, 0) / SPEED_OF_SOUND)
+                # Aceeași filtrare ca measure_distance(): sub 2 cm se întoarce 0,
+                # peste 100 cm -1
+                distance = 0 if gap < 2 else (gap if gap <= 100 else -1)
+                deliver(direction, distance, time.monotonic())
+                time.sleep(SENSOR_GAP)
+                if car.stop_time is not None:
+                    break
+        # Așteaptă ca firul UDP să termine intervenția în curs
+        time.sleep(0.01)
+    finally:
+        if use_udp:
+            listener.close()
+            publisher.close()
+
+    stops = [i for i in layer.interventions if i["action"] == "stop"]
+    if not stops:
+        return None
+    final_gap = car.wall - car.position - car.braking_distance
+    return stops[0]["latency_ms"], final_gap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reflex de evitare a coliziunilor")
+    parser.add_argument("--trials", type=int, default=20, help="numărul de încercări per mod")
+    parser.add_argument("--config", default=None, help="fișier JSON de configurare a reflexului")
+    args = parser.parse_args()
+
+    config = reflex.load_config(args.config)
+    config["log_file"] = None
+
+    for use_udp in (False, True):
+        mode = "UDP localhost" if use_udp else "în proces"
+        latencies, gaps, missed = [], [], 0
+        for _ in range(args.trials):
+            speed = random.randint(40, 100)
+            result = run_trial(config, speed, random.uniform(60, 100), use_udp)
+            if result is None:
+                missed += 1
+                continue
+            latencies.append(result[0])
+            gaps.append(result[1])
+
+        print(f"=== Reflex ({mode}) ===")
+        if latencies:
+            latencies.sort()
+            p95 = latencies[int(0.95 * (len(latencies) - 1))]
+            print(f"Latență citire -> oprire: mediana {statistics.median(latencies):.3f} ms, "
+                  f"p95 {p95:.3f} ms, maxim {latencies[-1]:.3f} ms")
+            print(f"Distanță rămasă după frânare: minim {min(gaps):.1f} cm, "
+                  f"medie {statistics.mean(gaps):.1f} cm")
+            print(f"Coliziuni: {sum(1 for g in gaps if g <= 0)} din {len(gaps)}")
+        if missed:
+            print(f"Încercări fără intervenție: {missed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+Potrivirea citirilor ultrasonice cu harta (scan matching).
+
+Un singur cadru are cel mult patru raze, prea puțin pentru o potrivire
+sigură. De aceea ScanMatcher adună citirile din ultimele cadre într-o
+sub-hartă locală (o fereastră glisantă de puncte) și o aliniază cu harta:
+
+1. căutare corelativă pe două rezoluții peste (dx, dy, dtheta): întâi pe o
+   grilă rară, cu un câmp de verosimilitate „max-pooled” care dă o limită
+   superioară pentru fiecare bloc, apoi pe grila fină doar în blocurile
+   cele mai bune
+2. rafinare ICP punct-la-punct față de cele mai apropiate celule ocupate
+
+Ferestrele de căutare presupun că eroarea odometriei între două potriviri
+este mică (câțiva cm, câteva grade), ceea ce cere senzori Hall cu mai multe
+impulsuri pe rotație; în explorer.py potrivirea este opțională.
+
+Câmpul de verosimilitate este precalculat și se actualizează doar în jurul
+celulelor a căror ocupare s-a schimbat. Totul este vectorizat în NumPy,
+pentru a rula la frecvența telemetriei pe un Raspberry Pi.
+"""
+
+import collections
+import math
+
+import numpy as np
+
+from occupancygrid import (SENSOR_ANGLES, MIN_RANGE, MAX_RANGE, distance_field,
+                           update_distance_field)
+
+# Sub-harta locală
+WINDOW_FRAMES = 20          # câte cadre recente intră în fereastră
+MIN_POINTS = 12             # sub acest număr de puncte nu se încearcă potrivirea
+
+# Câmpul de verosimilitate
+LIKELIHOOD_SIGMA = 3.0      # cm, zgomotul senzorului
+LIKELIHOOD_MAX_DISTANCE = 12.0  # cm; mai departe verosimilitatea e 0
+COARSE_FACTOR = 4           # latura blocului de căutare rară, în celule
+
+# Fereastra de căutare în jurul odometriei
+LINEAR_WINDOW = 16.0        # cm
+ANGULAR_WINDOW = math.radians(10)
+ANGULAR_STEP = math.radians(2)
+COARSE_CANDIDATES = 3       # câte blocuri rare se rafinează pe grila fină
+
+# ICP
+ICP_ITERATIONS = 5
+ICP_MAX_DISTANCE = 8.0      # cm; perechile mai depărtate sunt ignorate
+
+# O corecție este acceptată doar dacă potrivirea e suficient de bună
+MIN_SCORE = 0.4
+
+
+def rotation_candidates(window=ANGULAR_WINDOW, step=ANGULAR_STEP):
+    count = int(round(window / step))
+    return np.arange(-count, count + 1) * step
+
+
+def transform_points(points, center, dx, dy, dtheta):
+    """Rotește punctele (N, 2) cu dtheta în jurul lui center și le translatează"""
+    cos_t, sin_t = math.cos(dtheta), math.sin(dtheta)
+    rel = points - center
+    x = rel[:, 0] * cos_t - rel[:, 1] * sin_t + center[0] + dx
+    y = rel[:, 0] * sin_t + rel[:, 1] * cos_t + center[1] + dy
+    return np.column_stack((x, y))
+
+
+class LikelihoodField:
+    """
+    Câmpul de verosimilitate al hărții, cu versiunea lui rară, ambele în cache.
+
+    fine[r, c] = exp(-d^2 / 2 sigma^2), d = distanța la cel mai apropiat obstacol
+    coarse[r, c] = maximul lui fine pe blocul [r, r + f) x [c, c + f)
+    """
+
+    def __init__(self, grid, factor=COARSE_FACTOR):
+        self.grid = grid
+        self.factor = factor
+        self.max_cells = LIKELIHOOD_MAX_DISTANCE / grid.resolution
+        self.sigma_cells = LIKELIHOOD_SIGMA / grid.resolution
+        self.occupied = grid.occupied_mask()
+        self.distance = distance_field(self.occupied, self.max_cells)
+        self.fine = self.likelihood(self.distance)
+        self.coarse = self.block_max(self.fine)
+
+    def likelihood(self, distance):
+        field = np.exp(-0.5 * (distance / self.sigma_cells) ** 2)
+        field[distance >= self.max_cells] = 0.0
+        return field.astype(np.float32)
+
+    def block_max(self, fine):
+        f = self.factor
+        padded = np.pad(fine, ((0, f - 1), (0, f - 1)), constant_values=0.0)
+        rows, cols = fine.shape
+        coarse = fine.copy()
+        for dr in range(f):
+            for dc in range(f):
+                np.maximum(coarse, padded[dr:dr + rows, dc:dc + cols], out=coarse)
+        return coarse
+
+    def update(self):
+        """Recalculează câmpul doar în regiunea în care s-a schimbat ocuparea"""
+        occupied = self.grid.occupied_mask()
+        region = update_distance_field(self.distance, occupied,
+                                       occupied != self.occupied, self.max_cells)
+        self.occupied = occupied
+        if region is None:
+            return None
+
+        r0, r1, c0, c1 = region
+        self.fine[r0:r1, c0:c1] = self.likelihood(self.distance[r0:r1, c0:c1])
+
+        # Blocurile rare care încep cu până la f - 1 celule înainte de regiune o includ
+        f = self.factor
+        b0, b1 = max(r0 - f + 1, 0), r1
+        d0, d1 = max(c0 - f + 1, 0), c1
+        window = self.block_max(self.fine[b0:min(b1 + f - 1, self.fine.shape[0]),
+                                          d0:min(d1 + f - 1, self.fine.shape[1])])
+        self.coarse[b0:b1, d0:d1] = window[:b1 - b0, :d1 - d0]
+        return region
+
+    def score(self, field, rows, cols):
+        """Verosimilitatea medie pentru indici de orice formă (ultima axă = puncte)"""
+        inside = (rows >= 0) & (rows < field.shape[0]) & (cols >= 0) & (cols < field.shape[1])
+        values = np.where(inside, field[np.clip(rows, 0, field.shape[0] - 1),
+                                        np.clip(cols, 0, field.shape[1] - 1)], 0.0)
+        return values.mean(axis=-1)
+
+
+class ScanMatcher:
+    """
+    Corectează poza din odometrie aliniind fereastra de citiri cu harta.
+
+    Utilizare: după actualizarea odometriei, add_frame(frame, pose), apoi
+    match(pose); dacă potrivirea reușește, se întoarce poza corectată.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.field = LikelihoodField(grid)
+        self.frames = collections.deque(maxlen=WINDOW_FRAMES)
+        self.angles = rotation_candidates()
+        self.last_score = None
+
+    def add_frame(self, frame, pose):
+        """Transformă citirile cadrului în puncte în cadrul hărții și le adaugă ferestrei"""
+        points = []
+        for reading in frame.get("ultrasonic", []):
+            angle = SENSOR_ANGLES.get(reading.get("direction"))
+            distance = reading.get("distance", -1)
+            if angle is None or not MIN_RANGE <= distance < MAX_RANGE:
+                continue
+            x, y, theta = pose
+            if "offset" in reading:
+                dx, dy, dtheta = reading["offset"]
+                x += dx * math.cos(theta) - dy * math.sin(theta)
+                y += dx * math.sin(theta) + dy * math.cos(theta)
+                theta += dtheta
+            points.append((x + distance * math.cos(theta + angle),
+                           y + distance * math.sin(theta + angle)))
+        self.frames.append(np.array(points, dtype=float).reshape(-1, 2))
+
+    def window_points(self):
+        if not self.frames:
+            return np.zeros((0, 2))
+        return np.concatenate(list(self.frames))
+
+    def match(self, pose):
+        """
+        Aliniază fereastra cu harta; întoarce poza corectată sau None.
+
+        Corecția se aplică și punctelor din fereastră, care rămân astfel în
+        cadrul hărții corectate.
+        """
+        points = self.window_points()
+        if len(points) < MIN_POINTS:
+            return None
+
+        self.field.update()
+        if not self.field.occupied.any():
+            return None
+
+        center = np.array(pose[:2])
+        dx, dy, dtheta = self.correlative_search(points, center)
+        dx, dy, dtheta = self.icp(points, center, dx, dy, dtheta)
+
+        aligned = transform_points(points, center, dx, dy, dtheta)
+        rows, cols = self.grid.world_to_cell(aligned[:, 0], aligned[:, 1])
+        self.last_score = float(self.field.score(self.field.fine, rows, cols))
+        if self.last_score < MIN_SCORE:
+            return None
+
+        self.frames = collections.deque(
+            (transform_points(p, center, dx, dy, dtheta) if len(p) else p for p in self.frames),
+            maxlen=WINDOW_FRAMES)
+        return (pose[0] + dx, pose[1] + dy, pose[2] + dtheta)
+
+    def rotated(self, points, center):
+        """Punctele rotite cu toate unghiurile candidate: (A, N, 2)"""
+        rel = points - center
+        cos_a = np.cos(self.angles)[:, None]
+        sin_a = np.sin(self.angles)[:, None]
+        x = rel[None, :, 0] * cos_a - rel[None, :, 1] * sin_a + center[0]
+        y = rel[None, :, 0] * sin_a + rel[None, :, 1] * cos_a + center[1]
+        return np.stack((x, y), axis=-1)
+
+    def correlative_search(self, points, center):
+        res = self.grid.resolution
+        f = self.field.factor
+        rotated = self.rotated(points, center)
+        rows, cols = self.grid.world_to_cell(rotated[..., 0], rotated[..., 1])
+
+        # Pasul rar: translații din f în f celule, evaluate pe câmpul max-pooled
+        reach = int(math.ceil(LINEAR_WINDOW / res))
+        coarse_steps = np.arange(-reach, reach + 1, f)
+        tr, tc = np.meshgrid(coarse_steps, coarse_steps, indexing="ij")
+        tr, tc = tr.ravel(), tc.ravel()
+        scores = self.field.score(self.field.coarse,
+                                  rows[:, None, :] + tr[None, :, None],
+                                  cols[:, None, :] + tc[None, :, None])  # (A, T)
+
+        # Pasul fin: toate translațiile din blocurile rare cele mai promițătoare
+        best = np.argsort(scores, axis=None)[::-1][:COARSE_CANDIDATES]
+        fine_offsets = np.arange(f)
+        best_score, best_candidate = -1.0, (0, 0, 0)
+        for flat in best:
+            a, t = np.unravel_index(flat, scores.shape)
+            fr, fc = np.meshgrid(tr[t] + fine_offsets, tc[t] + fine_offsets, indexing="ij")
+            fr, fc = fr.ravel(), fc.ravel()
+            fine = self.field.score(self.field.fine,
+                                    rows[a][None, :] + fr[:, None],
+                                    cols[a][None, :] + fc[:, None])
+            i = int(np.argmax(fine))
+            if fine[i] > best_score:
+                best_score = fine[i]
+                best_candidate = (fc[i] * res, fr[i] * res, self.angles[a])
+        return best_candidate
+
+    def icp(self, points, center, dx, dy, dtheta):
+        """Rafinare ICP punct-la-punct față de centrele celulelor ocupate"""
+        occ_rows, occ_cols = np.nonzero(self.field.occupied)
+        occ_x, occ_y = self.grid.cell_to_world(occ_rows, occ_cols)
+        targets_all = np.column_stack((occ_x, occ_y))
+
+        for _ in range(ICP_ITERATIONS):
+            aligned = transform_points(points, center, dx, dy, dtheta)
+
+            # Doar obstacolele din jurul ferestrei pot fi perechi
+            lo = aligned.min(axis=0) - ICP_MAX_DISTANCE
+            hi = aligned.max(axis=0) + ICP_MAX_DISTANCE
+            near = np.all((targets_all >= lo) & (targets_all <= hi), axis=1)
+            targets = targets_all[near]
+            if len(targets) == 0:
+                break
+
+            d2 = ((aligned[:, None, :] - targets[None, :, :]) ** 2).sum(axis=-1)
+            nearest = d2.argmin(axis=1)
+            keep = d2[np.arange(len(aligned)), nearest] <= ICP_MAX_DISTANCE ** 2
+            if keep.sum() < MIN_POINTS // 2:
+                break
+            src = aligned[keep]
+            dst = targets[nearest[keep]]
+
+            # Transformarea rigidă optimă în 2D (formă închisă)
+            src_mean, dst_mean = src.mean(axis=0), dst.mean(axis=0)
+            a, b = src - src_mean, dst - dst_mean
+            angle = math.atan2((a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]).sum(),
+                               (a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1]).sum())
+            cos_t, sin_t = math.cos(angle), math.sin(angle)
+            step_x = dst_mean[0] - (src_mean[0] * cos_t - src_mean[1] * sin_t)
+            step_y = dst_mean[1] - (src_mean[0] * sin_t + src_mean[1] * cos_t)
+
+            # Compunerea pasului cu transformarea curentă, exprimată față de center
+            new_center = np.array([center[0] + dx, center[1] + dy])
+            moved = np.array([new_center[0] * cos_t - new_center[1] * sin_t + step_x,
+                              new_center[0] * sin_t + new_center[1] * cos_t + step_y])
+            dx, dy = moved[0] - center[0], moved[1] - center[1]
+            dtheta += angle
+            if abs(angle) < 1e-4 and math.hypot(step_x, step_y) < 1e-3:
+                break
+
+        return dx, dy, dtheta
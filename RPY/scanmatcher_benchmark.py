@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark pentru corectarea odometriei prin scan matching, în simulare.
+
+Explorer rulează într-o arenă pătrată, iar un robot simulat execută
+comenzile lui. Roțile se rotesc continuu; senzorii Hall numără impulsuri
+întregi din rotația roților, dar o roată alunecă (se deplasează cu SLIP
+mai puțin decât arată rotația), deci odometria are derivă. Se compară
+eroarea pozei estimate cu și fără scan matching.
+
+Planificarea este împărțită în felii de timp, deci rulările nu sunt perfect
+deterministe; pentru comparații se folosesc mai multe încercări.
+"""
+
+import argparse
+import math
+import random
+import statistics
+import time
+
+import explorer
+import occupancygrid
+from fleetaggregator import simulated_range
+from occupancygrid import SENSOR_ANGLES, MAX_RANGE, WHEEL_BASE
+
+ARENA = 120.0          # cm, latura arenei
+WHEEL_SPEED = 15.0     # cm/s, viteza roților în simulare
+SENSOR_NOISE = 0.5     # cm
+STEPS = 1500           # cadre de telemetrie
+
+# Semnul fiecărei roți pentru comenzile explorării
+COMMAND_SIGNS = {"F": (1, 1), "B": (-1, -1), "L": (-1, 1), "R": (1, -1), "S": (0, 0)}
+
+
+def set_ticks_per_rev(ticks_per_rev):
+    """Schimbă rezoluția odometriei în modulele care o folosesc"""
+    occupancygrid.TICKS_PER_REV = ticks_per_rev
+    occupancygrid.CM_PER_TICK = math.pi * occupancygrid.WHEEL_DIAMETER / ticks_per_rev
+    explorer.TURN_STEP = 2 * occupancygrid.CM_PER_TICK / WHEEL_BASE
+
+
+def run_trial(matching, slip, seed, steps=STEPS):
+    """
+    O explorare simulată; întoarce erorile de poziție (cm) la fiecare cadru.
+
+    Simularea se oprește când explorarea se termină sau când robotul real
+    iese din arenă (poza estimată a fost atât de greșită încât a trecut
+    prin perete).
+    """
+    random.seed(seed)
+    start = (0.0, 0.0, 0.3)
+    robot = explorer.Explorer(pose=start, scan_matching=matching)
+    x, y, theta = start
+    state = {"command": "S"}
+    rotation = [0.0, 0.0]  # rotația roților încă nenumărată, în impulsuri
+    errors = []
+
+    def send_command(command):
+        state["command"] = command.split(":", 1)[0]
+
+    for _ in range(steps):
+        signs = COMMAND_SIGNS[state["command"]]
+        travel = WHEEL_SPEED * explorer.TELEMETRY_PERIOD
+
+        # Impulsurile numărate vin din rotația roții
+        ticks = []
+        for i in range(2):
+            rotation[i] += abs(signs[i]) * travel / occupancygrid.CM_PER_TICK
+            whole = int(rotation[i])
+            rotation[i] -= whole
+            ticks.append(whole)
+
+        # Deplasarea reală: roata dreaptă alunecă
+        d_left = signs[0] * travel
+        d_right = signs[1] * travel * (1 - slip)
+        d_theta = (d_right - d_left) / WHEEL_BASE
+        x += (d_left + d_right) / 2 * math.cos(theta + d_theta / 2)
+        y += (d_left + d_right) / 2 * math.sin(theta + d_theta / 2)
+        theta += d_theta
+        if max(abs(x), abs(y)) >= ARENA / 2:
+            break
+
+        ultrasonic = []
+        for direction, angle in SENSOR_ANGLES.items():
+            distance = simulated_range(x, y, theta + angle, ARENA / 2)
+            distance += random.gauss(0, SENSOR_NOISE)
+            if distance < MAX_RANGE:
+                ultrasonic.append({"direction": direction, "distance": distance})
+
+        frame = {
+            "ultrasonic": ultrasonic,
+            "hall_sensors": {"left_wheel": ticks[0], "right_wheel": ticks[1]},
+        }
+        if signs != (0, 0):
+            frame["wheel_signs"] = {"left_wheel": signs[0], "right_wheel": signs[1]}
+        robot.step(frame, send_command)
+
+        estimate_x, estimate_y, _ = robot.odometry.pose()
+        errors.append(math.hypot(estimate_x - x, estimate_y - y))
+        if robot.finished:
+            break
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scan matching")
+    parser.add_argument("--trials", type=int, default=3, help="numărul de încercări per mod")
+    parser.add_argument("--slip", type=float, default=0.08,
+                        help="alunecarea roții drepte (fracție din deplasare)")
+    parser.add_argument("--ticks-per-rev", type=int, default=occupancygrid.TICKS_PER_REV,
+                        help="impulsuri Hall la o rotație a roții")
+    args = parser.parse_args()
+
+    set_ticks_per_rev(args.ticks_per_rev)
+    print(f"Arenă {ARENA:.0f} cm, alunecare {args.slip:.0%}, "
+          f"{args.ticks_per_rev} impulsuri/rotație ({occupancygrid.CM_PER_TICK:.1f} cm/impuls)")
+
+    for matching in (False, True):
+        finals, maxima, lengths = [], [], []
+        started = time.monotonic()
+        for trial in range(args.trials):
+            errors = run_trial(matching, args.slip, seed=trial)
+            finals.append(errors[-1])
+            maxima.append(max(errors))
+            lengths.append(len(errors))
+        elapsed = time.monotonic() - started
+
+        print(f"=== Scan matching {'pornit' if matching else 'oprit'} ===")
+        print(f"Eroare finală: medie {statistics.mean(finals):.1f} cm, "
+              f"maxim {max(finals):.1f} cm")
+        print(f"Eroare maximă în timpul rulării: medie {statistics.mean(maxima):.1f} cm")
+        print(f"Cadre simulate: {lengths}, timp {elapsed:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
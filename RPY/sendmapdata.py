@@ -5,6 +5,8 @@ import json
 import asyncio
 import websockets
 from threading import Thread, Lock
+from reflex import ReflexPublisher, MotionListener
+from deskew import deskew_frame
 
 # Configurare GPIO
 GPIO.setmode(GPIO.BCM)
@@ -39,27 +41,50 @@ hall_last_state_1 = GPIO.input(HALL_SENSOR_1)
 hall_last_state_2 = GPIO.input(HALL_SENSOR_2)
 hall_lock = Lock()
 
+# Momentele (time.monotonic) fiecărui impuls Hall de la ultima citire a contorilor
+hall_ticks_1 = []
+hall_ticks_2 = []
+
+# Senzorii Hall nu dau sensul de rotație; carcontrolbt.py anunță sensul
+# roților, iar fiecare impuls e numărat cu semnul sensului curent
+motion_listener = MotionListener()
+motion_listener.start()
+hall_signed_1 = 0
+hall_signed_2 = 0
+
+# Cât de des se trimite corespondența dintre ceasul monoton și ceasul de perete
+CLOCK_SYNC_PERIOD = 5.0  # secunde
+last_clock_sync = None
+
+# Proiectează citirile unui cadru pe poza de la sfârșitul cadrului, folosind
+# odometria și sensul roților anunțat de carcontrolbt.py; dezactivat implicit,
+# clienții pot face corecția singuri
+DESKEW = False
+
+# Citirile sunt trimise imediat reflexului de evitare a coliziunilor din carcontrolbt.py
+reflex_publisher = ReflexPublisher()
+
 # Funcție pentru măsurare ultrasonică
 def measure_distance(trig_pin, echo_pin):
     GPIO.output(trig_pin, True)
     time.sleep(0.00001)
     GPIO.output(trig_pin, False)
     
-    start_time = time.time()
-    stop_time = time.time()
+    start_time = time.monotonic()
+    stop_time = time.monotonic()
     
     # Așteaptă start semnal
-    timeout_start = time.time()
+    timeout_start = time.monotonic()
     while GPIO.input(echo_pin) == 0:
-        start_time = time.time()
-        if time.time() - timeout_start > 0.1:  # timeout de 100ms
+        start_time = time.monotonic()
+        if time.monotonic() - timeout_start > 0.1:  # timeout de 100ms
             return -1
     
     # Așteaptă stop semnal
-    timeout_start = time.time()
+    timeout_start = time.monotonic()
     while GPIO.input(echo_pin) == 1:
-        stop_time = time.time()
-        if time.time() - timeout_start > 0.1:  # timeout de 100ms
+        stop_time = time.monotonic()
+        if time.monotonic() - timeout_start > 0.1:  # timeout de 100ms
             return -1
     
     # Calculează distanța
@@ -67,7 +92,9 @@ def measure_distance(trig_pin, echo_pin):
     distance = (time_elapsed * 34300) / 2  # în cm
     
     # Filtrare valori aberante
-    if distance < 2 or distance > 100:  # Limitează la 1 metru (dimensiunea cutiei)
+    if distance < 2:  # Obstacol prea aproape pentru senzor
+        return 0
+    if distance > 100:  # Limitează la 1 metru (dimensiunea cutiei)
         return -1
     
     return distance
@@ -77,29 +104,40 @@ def read_all_ultrasonic():
     measurements = []
     for sensor in ULTRASONIC_PINS:
         distance = measure_distance(sensor["TRIG"], sensor["ECHO"])
+        # Fiecare citire are momentul ei, pe ceasul monoton
+        timestamp = time.monotonic()
+        # Reflexul primește și 0 (prea aproape), ca să oprească motoarele
+        reflex_publisher.publish(sensor["direction"], distance, timestamp)
         if distance > 0:  # Verifică dacă măsurătoarea este validă
             measurements.append({
                 "direction": sensor["direction"],
-                "distance": distance
+                "distance": distance,
+                "t": timestamp
             })
         time.sleep(0.01)  # Mică pauză pentru a evita interferențele
     return measurements
 
 # Funcții pentru tratarea senzorilor Hall
 def hall_sensor_1_callback(channel):
-    global hall_counter_1, hall_last_state_1
+    global hall_counter_1, hall_signed_1, hall_last_state_1
+    timestamp = time.monotonic()
     current_state = GPIO.input(channel)
     if current_state != hall_last_state_1:
         with hall_lock:
             hall_counter_1 += 1
+            hall_signed_1 += motion_listener.signs[0]
+            hall_ticks_1.append(timestamp)
         hall_last_state_1 = current_state
 
 def hall_sensor_2_callback(channel):
-    global hall_counter_2, hall_last_state_2
+    global hall_counter_2, hall_signed_2, hall_last_state_2
+    timestamp = time.monotonic()
     current_state = GPIO.input(channel)
     if current_state != hall_last_state_2:
         with hall_lock:
             hall_counter_2 += 1
+            hall_signed_2 += motion_listener.signs[1]
+            hall_ticks_2.append(timestamp)
         hall_last_state_2 = current_state
 
 # Înregistrare callback-uri pentru senzori Hall
@@ -108,39 +146,135 @@ GPIO.add_event_detect(HALL_SENSOR_2, GPIO.BOTH, callback=hall_sensor_2_callback)
 
 # Funcție pentru citirea contorilor Hall și resetarea lor
 def read_hall_sensors():
-    global hall_counter_1, hall_counter_2
+    global hall_counter_1, hall_counter_2, hall_ticks_1, hall_ticks_2
+    global hall_signed_1, hall_signed_2
     with hall_lock:
         count1 = hall_counter_1
         count2 = hall_counter_2
+        ticks1 = hall_ticks_1
+        ticks2 = hall_ticks_2
+        signed1 = hall_signed_1
+        signed2 = hall_signed_2
         hall_counter_1 = 0
         hall_counter_2 = 0
-    return count1, count2
+        hall_ticks_1 = []
+        hall_ticks_2 = []
+        hall_signed_1 = 0
+        hall_signed_2 = 0
+        timestamp = time.monotonic()
+    
+    # Sensul predominant al fiecărei roți în cadru; fără impulsuri, sensul curent
+    left_sign, right_sign = motion_listener.signs
+    if signed1 != 0:
+        left_sign = 1 if signed1 > 0 else -1
+    if signed2 != 0:
+        right_sign = 1 if signed2 > 0 else -1
+    return count1, count2, ticks1, ticks2, (left_sign, right_sign), timestamp
 
 # Funcție pentru colectarea tuturor datelor
 def collect_data():
+    global last_clock_sync
     ultrasonic_data = read_all_ultrasonic()
-    hall_counts = read_hall_sensors()
+    count1, count2, ticks1, ticks2, signs, hall_time = read_hall_sensors()
     
     data = {
         "timestamp": time.time(),
+        "monotonic": hall_time,  # momentul la care au fost citiți contorii Hall
         "ultrasonic": ultrasonic_data,
         "hall_sensors": {
-            "left_wheel": hall_counts[0],
-            "right_wheel": hall_counts[1]
+            "left_wheel": count1,
+            "right_wheel": count2
+        },
+        "hall_ticks": {
+            "left_wheel": ticks1,
+            "right_wheel": ticks2
+        },
+        "wheel_signs": {
+            "left_wheel": signs[0],
+            "right_wheel": signs[1]
         }
     }
+    
+    # Periodic, corespondența ceas monoton -> ceas de perete, pentru clienți
+    if last_clock_sync is None or hall_time - last_clock_sync >= CLOCK_SYNC_PERIOD:
+        data["clock"] = {"monotonic": time.monotonic(), "wall": time.time()}
+        last_clock_sync = hall_time
+    
+    if DESKEW:
+        deskew_frame(data, *signs)
     return data
 
+# Clienții WebSocket primesc cadre la fiecare 100ms, oricât de des sunt citiți senzorii
+SEND_PERIOD = 0.1
+
+# Clienții WebSocket conectați: fiecare are o coadă cu cel mult un cadru
+subscribers = set()
+subscribers_lock = Lock()
+
+# Combină un cadru netrimis cu cel nou, fără să se piardă impulsurile Hall
+def merge_frames(old, new):
+    merged = dict(new)
+    merged["hall_sensors"] = {
+        wheel: old["hall_sensors"][wheel] + count
+        for wheel, count in new["hall_sensors"].items()
+    }
+    merged["hall_ticks"] = {
+        wheel: old["hall_ticks"][wheel] + ticks
+        for wheel, ticks in new["hall_ticks"].items()
+    }
+    # O roată fără impulsuri în cadrul nou păstrează sensul din cel vechi
+    merged["wheel_signs"] = {
+        wheel: sign if new["hall_sensors"][wheel] else old["wheel_signs"][wheel]
+        for wheel, sign in new["wheel_signs"].items()
+    }
+    if "clock" in old and "clock" not in new:
+        merged["clock"] = old["clock"]
+    return merged
+
+# Rulează în bucla clientului: cadrul vechi, dacă nu a fost trimis, e înlocuit
+def offer_frame(queue, data):
+    if queue.full():
+        data = merge_frames(queue.get_nowait(), data)
+    queue.put_nowait(data)
+
+# Citirea senzorilor rulează continuu, chiar și fără clienți conectați,
+# pentru ca reflexul de evitare a coliziunilor să primească citiri mereu
+def sensor_loop():
+    while True:
+        try:
+            data = collect_data()
+        except Exception as e:
+            print(f"Eroare la citirea senzorilor: {e}")
+            time.sleep(0.1)
+            continue
+        with subscribers_lock:
+            for loop, queue in subscribers:
+                loop.call_soon_threadsafe(offer_frame, queue, data)
+
 # WebSocket server
-async def websocket_server(websocket, path):
+async def websocket_server(websocket, path=None):
+    loop = asyncio.get_running_loop()
+    subscriber = (loop, asyncio.Queue(maxsize=1))
+    with subscribers_lock:
+        subscribers.add(subscriber)
     try:
         print("Client conectat")
+        next_send = loop.time()
         while True:
-            data = collect_data()
+            # Trimite cel mai recent cadru, la fiecare 100ms
+            data = await subscriber[1].get()
             await websocket.send(json.dumps(data))
-            await asyncio.sleep(0.1)  # Trimite date la fiecare 100ms
+            next_send += SEND_PERIOD
+            delay = next_send - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_send = loop.time()
     except websockets.exceptions.ConnectionClosed:
         print("Conexiune închisă")
+    finally:
+        with subscribers_lock:
+            subscribers.discard(subscriber)
 
 # Pornește serverul WebSocket
 def start_websocket_server():
@@ -160,6 +294,11 @@ websocket_thread = Thread(target=start_websocket_server)
 websocket_thread.daemon = True
 websocket_thread.start()
 
+# Pornire citire senzori în thread separat
+sensor_thread = Thread(target=sensor_loop)
+sensor_thread.daemon = True
+sensor_thread.start()
+
 # Înregistrează funcția de curățare
 import atexit
 atexit.register(cleanup)